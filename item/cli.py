@@ -89,11 +89,27 @@ def mkdirs(path, dry_run):
 
 
 @main.command()
-def template():
+@click.option(
+    "--format",
+    "formats",
+    default="csv,xlsx",
+    show_default=True,
+    help="Comma-separated file formats: csv, parquet, and/or xlsx.",
+)
+@click.option(
+    "-j", "--jobs", type=int, default=3, help="Number of variants to write at once."
+)
+def template(formats, jobs):
     """Generate the MIP submission template."""
     from item.structure import make_template
+    from item.structure.template import FORMATS
+
+    formats = formats.split(",")
+    unknown = sorted(set(formats) - set(FORMATS))
+    if unknown:
+        raise click.BadParameter(f"unknown format(s) {unknown}", param_hint="--format")
 
-    make_template()
+    make_template(formats=formats, workers=jobs)
 
 
 @main.command("update-dsd")
@@ -1,20 +1,38 @@
+import hashlib
+import json
 import logging
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from copy import deepcopy
-from functools import lru_cache
+from functools import lru_cache, partial
 from importlib import import_module
+from itertools import chain
 from pathlib import Path
-from typing import Dict, Optional, Union
+from pkgutil import iter_modules
+from threading import BoundedSemaphore
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
 
 import pandas as pd
 import pycountry
 import yaml
-from platformdirs import user_data_path
+from platformdirs import user_cache_path, user_data_path
 
 from item.common import paths
-from item.remote import OpenKAPSARC, get_sdmx
-from item.structure import generate
-from item.util import metadata_repo_file
+from item.remote import OpenKAPSARC, download, iter_sdmx, retry, write_sdmx
+from item.structure import base, generate
+from item.structure.sdmx import get_validator
+from item.util import (
+    atomic_path,
+    file_hash,
+    map_categorical,
+    metadata_repo_file,
+    package_version,
+    peak_rss_mb,
+    write_atomic,
+)
 
 log = logging.getLogger(__name__)
 
@@ -24,7 +42,7 @@ OUTPUT_PATH = user_data_path("item").joinpath("historical", "output")
 
 #: Non-ISO 3166 names that appear in 1 or more data sets. These are used in
 #: :meth:`iso_alpha_3` to replace names before they are looked up using
-#: mod:`pycountry`.
+#: mod:`pycountry`, and are included in :func:`get_iso_index`.
 COUNTRY_NAME = {
     "azerbaidjan": "AZE",
     "bolivia (plurinational state of)": "BOL",
@@ -82,15 +100,19 @@ with open(metadata_repo_file("historical", "sources.yaml")) as f:
     SOURCES = yaml.safe_load(f)
 
 
-def cache_results(id_str: str, df: pd.DataFrame) -> None:
-    """Write `df` to :data:`.OUTPUT_PATH` in two file formats.
+#: File formats for output from :func:`cache_results`.
+FORMATS = ("csv", "feather", "parquet")
+
+
+def cache_results(id_str: str, df: pd.DataFrame, fmt: str = "csv") -> None:
+    """Write `df` to :data:`.OUTPUT_PATH` in two layouts.
 
     The files written are:
 
-    - :file:`{id_str}-clean.csv`, in long (previously ‘programming-friendly’ or ‘PF’)
+    - :file:`{id_str}-clean.{fmt}`, in long (previously ‘programming-friendly’ or ‘PF’)
       format, i.e. with all years or other time periods in ``TIME_PERIOD`` column and
       one observation per row.
-    - :file:`{id_str}-clean-wide.csv`, in wide (previously ‘user-friendly’ or ‘UF’)
+    - :file:`{id_str}-clean-wide.{fmt}`, in wide (previously ‘user-friendly’ or ‘UF’)
       format, with one column per year/``TIME_PERIOD``.
       For convenience, this file has two additional columns:
 
@@ -98,12 +120,22 @@ def cache_results(id_str: str, df: pd.DataFrame) -> None:
         appearing in the ``REF_AREA`` column.
       - ``ITEM_REGION``: this gives the name of the iTEM region to which the data
         correspond.
+
+    Parameters
+    ----------
+    fmt : str, optional
+        One of :data:`FORMATS`: “csv” for comma-separated values; “parquet” for Apache
+        Parquet; or “feather” for Apache Arrow IPC. The latter two require
+        :mod:`pyarrow`, and store dimension columns as dictionary-encoded categoricals.
     """
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt={fmt!r}; expected one of {FORMATS}")
+
     OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
 
     # Long format ('programming friendly view')
-    path = OUTPUT_PATH / f"{id_str}-clean.csv"
-    df.to_csv(path, index=False)
+    path = OUTPUT_PATH / f"{id_str}-clean.{fmt}"
+    _write(df, path)
     log.info(f"Write {path}")
 
     # Pivot to wide format ('user friendly view')
@@ -119,7 +151,7 @@ def cache_results(id_str: str, df: pd.DataFrame) -> None:
         return
 
     # Write wide format
-    path = OUTPUT_PATH / f"{id_str}-clean-wide.csv"
+    path = OUTPUT_PATH / f"{id_str}-clean-wide.{fmt}"
 
     # - Add the iTEM region and country name. NB this would be slightly faster after
     #   unstacking, but would require more complicated code to get the desired column
@@ -128,27 +160,88 @@ def cache_results(id_str: str, df: pd.DataFrame) -> None:
     # - Unstack the TIME_PERIOD dimension to columns, i.e. wide format.
     # - Return the index to columns in the dataframe.
     # - Write to file.
+    from item.model import get_region_map
+
     columns.extend(["NAME", "ITEM_REGION"])
     df.assign(
-        NAME=lambda df_: df_["REF_AREA"].apply(get_country_name),
-        ITEM_REGION=lambda df_: df_["REF_AREA"].apply(get_item_region),
-    ).set_index(columns)["VALUE"].unstack("TIME_PERIOD").reset_index().to_csv(
-        path, index=False
+        NAME=lambda df_: map_categorical(df_["REF_AREA"], get_country_name_map()),
+        ITEM_REGION=lambda df_: map_categorical(
+            df_["REF_AREA"], get_region_map("item"), "N/A"
+        ),
+    ).set_index(columns)["VALUE"].unstack("TIME_PERIOD").reset_index().pipe(
+        _write, path
     )
     log.info(f"Write {path}")
 
 
-def fetch_source(id: Union[int, str], use_cache: bool = True) -> Path:
+def _write(df: pd.DataFrame, path: Path) -> None:
+    """Write `df` to `path`, using a file format according to the suffix of `path`."""
+    if path.suffix == ".csv":
+        df.to_csv(path, index=False)
+        return
+
+    # - Store non-numeric columns (dimensions, UNIT, etc.) as categoricals. These are
+    #   written as dictionary-encoded columns.
+    # - Store TIME_PERIOD as integer, if it is a column (long format).
+    # - Both file formats require string column names; convert TIME_PERIOD values in
+    #   the column names (wide format).
+    dtypes = {c: "category" for c in df.select_dtypes(exclude="number").columns}
+    if "TIME_PERIOD" in df.columns:
+        dtypes["TIME_PERIOD"] = "int64"
+    df = df.astype(dtypes).rename(columns=str)
+
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_feather(path)
+
+
+def cache_key(path: Path, dataset_module) -> str:
+    """Return a key for the result of processing the input data at `path`.
+
+    The key changes if any of the following change:
+
+    - The contents of the file at `path`.
+    - The source code of `dataset_module`, e.g. :mod:`.T001`, or of the common
+      processing code in :mod:`item.historical`.
+    - The version of the iTEM data structures, :data:`.structure.base.VERSION`.
+    - The version of the :mod:`item` package.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    for value in (
+        file_hash(path),
+        file_hash(dataset_module.__file__),
+        file_hash(__file__),
+        base.VERSION,
+        package_version(),
+    ):
+        h.update(value.encode())
+    return h.hexdigest()
+
+
+def fetch_source(
+    id: Union[int, str], use_cache: bool = True, retries: int = 3, backoff: float = 1.0
+) -> Path:
     """Fetch amd cached data from source `id`.
 
     The remote data is fetched using the API for the particular source. A network
-    connection is required.
+    connection is required. For SDMX sources, the ``fetch:`` section of
+    :file:`sources.yaml` may include the `split_by` and/or `periods` arguments to
+    :func:`.iter_sdmx`, so that large data flows are retrieved in chunks. For sources
+    with ``type: URL``, the file at ``url:`` is retrieved using :func:`.download`.
+
+    The cached data is written to a temporary file, which replaces any existing file
+    only when complete.
 
     Parameters
     ----------
     use_cache : bool, optional
         If :obj:`True`, use a cached local file, if available. No check of cache
         validity is performed.
+    retries : int, optional
+        Number of times to retry after network errors; see :func:`.retry`.
+    backoff : float, optional
+        Initial delay between retries, in seconds.
 
     Returns
     -------
@@ -169,23 +262,102 @@ def fetch_source(id: Union[int, str], use_cache: bool = True) -> Path:
     # Information for fetching the data
     fetch_info = source_info["fetch"]
 
-    remote_type = fetch_info.pop("type")
-    if remote_type.lower() == "sdmx":
-        # Use SDMX to retrieve the data
-        result = get_sdmx(**fetch_info)
-    elif remote_type.lower() == "openkapsarc":
+    remote_type = fetch_info.pop("type").lower()
+    if remote_type == "url":
+        # Download a file, resuming if interrupted
+        return download(
+            fetch_info.pop("url"),
+            cache_path,
+            retries=retries,
+            backoff=backoff,
+            **fetch_info,
+        )
+    elif remote_type == "sdmx":
+        # Use SDMX to retrieve the data, possibly in chunks, and write each to the cache
+        # file as it arrives
+        retry(lambda: write_sdmx(cache_path, iter_sdmx(**fetch_info)), retries, backoff)
+        return cache_path
+    elif remote_type == "openkapsarc":
         # Retrieve data using the OpenKAPSARC API
-        ok_api = OpenKAPSARC(api_key=os.environ.get("OK_API_KEY", None))
+        ok_api = OpenKAPSARC(
+            api_key=os.environ.get("OK_API_KEY", None), retries=retries, backoff=backoff
+        )
         result = ok_api.table(**fetch_info)
     else:
         raise ValueError(remote_type)
 
     # Cache the results
-    result.to_csv(cache_path, index=False)
+    with atomic_path(cache_path) as tmp:
+        result.to_csv(tmp, index=False)
 
     return cache_path
 
 
+def _source_host(fetch_info: Dict) -> str:
+    """Return the host from which data is fetched, given `fetch_info`."""
+    remote_type = fetch_info["type"].lower()
+    if remote_type == "url":
+        return urlparse(fetch_info["url"]).netloc
+    else:
+        # SDMX source ID, e.g. "OECD", or the remote type
+        return fetch_info.get("source", remote_type)
+
+
+def fetch_many(
+    ids: Optional[Iterable[Union[int, str]]] = None,
+    workers: int = 4,
+    per_host: int = 2,
+    **kwargs,
+) -> Tuple[Dict[str, Path], Dict[str, Exception]]:
+    """Fetch data from multiple sources given their `ids`, concurrently.
+
+    Each source is fetched using :func:`fetch_source`, in a pool of `workers` threads.
+    At most `per_host` sources are fetched at once from the same host or SDMX data
+    source, e.g. "OECD".
+
+    Parameters
+    ----------
+    ids : iterable of int or str, optional
+        Data source ids. Duplicates are fetched only once. If not given, all sources in
+        :data:`SOURCES` with a ``fetch:`` section are fetched.
+    kwargs :
+        Passed to :func:`fetch_source`, e.g. `use_cache`, `retries`.
+
+    Returns
+    -------
+    dict of str → pathlib.Path
+        Paths to the fetched data, keyed by the canonical ID from :func:`source_str`.
+    dict of str → Exception
+        Errors for sources that could not be fetched.
+    """
+    if ids is None:
+        ids = [id for id, info in SOURCES.items() if "fetch" in info]
+
+    # Canonical IDs, without duplicates, in order
+    id_strs = list(dict.fromkeys(map(source_str, ids)))
+
+    hosts = {id_str: _source_host(SOURCES[id_str]["fetch"]) for id_str in id_strs}
+    limits = {host: BoundedSemaphore(per_host) for host in set(hosts.values())}
+
+    def _fetch(id_str: str) -> Path:
+        with limits[hosts[id_str]]:
+            return fetch_source(id_str, **kwargs)
+
+    results: Dict[str, Path] = dict()
+    errors: Dict[str, Exception] = dict()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {id_str: executor.submit(_fetch, id_str) for id_str in id_strs}
+
+        for id_str, future in futures.items():
+            try:
+                results[id_str] = future.result()
+            except Exception as e:
+                log.error(f"{id_str}: {e!r}")
+                errors[id_str] = e
+
+    return results, errors
+
+
 def input_file(id: int):
     """Return the path to a cached, raw input data file for data source `id`.
 
@@ -199,9 +371,19 @@ def input_file(id: int):
     return all_files[-1]
 
 
-def process(id: Union[int, str]) -> pd.DataFrame:
+def process(
+    id: Union[int, str],
+    use_cache: bool = True,
+    fmt: str = "csv",
+    validate: bool = False,
+    profile: Optional[List[Dict[str, Any]]] = None,
+) -> pd.DataFrame:
     """Process a data set given its *id*.
 
+    If `use_cache` is :obj:`True` and the same input data was previously processed by
+    the same code, the cached result is returned and steps (3) to (11) below are
+    skipped, except (10). See :func:`cache_key`.
+
     Performs the following common processing steps:
 
     1. Fetch the unprocessed upstream data, or load it from cache.
@@ -218,7 +400,7 @@ def process(id: Union[int, str]) -> pd.DataFrame:
     6. If the ``REF_AREA`` dimension is not already populated, assign ISO 3166 alpha-3
        codes, using a column containing country names: either
        :data:`COLUMNS['country_name']` or the default, 'Country'.
-       See :meth:`iso_alpha_3`.
+       See :meth:`iso_alpha_3_column`.
     7. Assign values to other dimensions:
 
        a. From the dataset's (optional) :data:`DATAFLOW` variable.
@@ -230,19 +412,38 @@ def process(id: Union[int, str]) -> pd.DataFrame:
     8. Order columns according to the ``HISTORICAL`` data structure.
     9. Check for missing values or missing dimension labels. A fully cleaned data set
        has none.
-    10. Output data to two files. See :meth:`cache_results`.
+    10. If `validate` is :obj:`True`, check that every key uses codes from the iTEM
+        code lists, and is within any constraint for the :data:`DATAFLOW`. See
+        :class:`.KeyValidator`.
+    11. Output data to two files in the format `fmt`. See :meth:`cache_results`.
 
     Parameters
     ----------
     id : int
         Data source id.
+    use_cache : bool, optional
+        If :obj:`False`, always process the data, and then update the cache.
+    fmt : str, optional
+        File format for output data; passed to :func:`cache_results`.
+    validate : bool, optional
+        If :obj:`True`, perform step (10).
+    profile : list, optional
+        If given, one :class:`dict` is appended for each step performed, with the keys
+        "source", "step", "seconds", "rows", and "peak_rss_mb". See :func:`profile_many`.
 
     Returns
     -------
     pandas.DataFrame
         The processed data.
+
+    Raises
+    ------
+    RuntimeError
+        if the data has missing values, or if `validate` is :obj:`True` and any keys are
+        invalid.
     """
     id_str = source_str(id)
+    step = _StepRecorder(id_str, profile)
 
     # Get the module for this data set
     dataset_module = import_module(f"item.historical.{id_str}")
@@ -255,8 +456,24 @@ def process(id: Union[int, str]) -> pd.DataFrame:
         # TODO remove this option; always fetch from source or cache
         path = metadata_repo_file("historical", "input", f"{id_str}_input.csv")
 
+    # Path for the cached result of processing this input with the current code
+    processed_path = OUTPUT_PATH.joinpath(
+        "cache", f"{id_str}-{cache_key(path, dataset_module)}.pkl"
+    )
+    # Data flow for this data set
+    df_id = getattr(dataset_module, "DATAFLOW", None)
+    step("fetch")
+
+    if use_cache and processed_path.exists():
+        df = _from_cache(id_str, processed_path, fmt)
+        step("from_cache", df)
+        if validate:
+            _validate(df, df_id)
+        return df
+
     # Read the data
     df = pd.read_csv(path, sep=getattr(dataset_module, "CSV_SEP", ","))
+    step("read", df)
 
     try:
         # Check that the input data is of the form expected by process()
@@ -269,6 +486,7 @@ def process(id: Union[int, str]) -> pd.DataFrame:
         msg = "Input data is invalid"
         log.error(f"{msg}: {e}")
         raise RuntimeError(msg)
+    step("check", df)
 
     # Information about columns. If not defined, use defaults.
     COLUMNS = getattr(dataset_module, "COLUMNS", {})
@@ -281,18 +499,18 @@ def process(id: Union[int, str]) -> pd.DataFrame:
     else:
         # No variable COLUMNS in dataset_module, or no key 'drop'
         log.info(f"No columns to drop for {id_str}")
+    step("drop", df)
 
     # Call the dataset-specific process() function; returns a modified df
     df = getattr(dataset_module, "process")(df)
     log.info(f"{len(df)} observations")
+    step("process", df)
 
     if "REF_AREA" not in df.columns:
         # Assign ISO 3166 alpha-3 codes from a country name column
         country_col = COLUMNS.get("country_name", "Country")
-
-        # Use pandas.Series.apply() to apply the same function to each entry in
-        # the column. Join these to the existing data frame as additional columns.
-        df = df.assign(REF_AREA=df[country_col].apply(iso_alpha_3))
+        df = df.assign(REF_AREA=iso_alpha_3_column(df[country_col]))
+    step("ref_area", df)
 
     df = df.rename(columns=dim_id_for_column_name)
 
@@ -302,7 +520,6 @@ def process(id: Union[int, str]) -> pd.DataFrame:
     assign_values = {"ID": id_str}
 
     # Assign "_Z" (not applicable) for dimensions not relevant to this data flow
-    df_id = getattr(dataset_module, "DATAFLOW", None)
     for dim, value in fill_values_for_dataflow(df_id).items():
         if dim in df.columns:
             # Mismatch: the data set returns detail here that's not specified in the
@@ -330,8 +547,60 @@ def process(id: Union[int, str]) -> pd.DataFrame:
             columns=["ID"] + [dim.id for dim in dsd.dimensions] + ["VALUE", "UNIT"]
         )
     )
+    step("order", df)
+
+    # Check for missing values and, optionally, invalid keys
+    _check(df, df_id, validate)
+    step("validate", df)
+
+    # Store the result for reuse; remove results from other input data or code
+    for other in processed_path.parent.glob(f"{id_str}-*.pkl"):
+        other.unlink(missing_ok=True)
+    processed_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_pickle(processed_path)
+
+    # Save the result to cache
+    _cache_results(id_str, df, fmt, processed_path)
+    step("output", df)
+
+    # Return the data for use by other code
+    return df
+
+
+class _StepRecorder:
+    """Record the wall time, peak RSS, and rows after each step of :func:`process`.
 
-    # Check for missing values
+    If `records` is :obj:`None`, calls do nothing.
+    """
+
+    def __init__(self, source: str, records: Optional[List[Dict[str, Any]]]):
+        self.source = source
+        self.records = records
+        self.start = perf_counter()
+
+    def __call__(self, step: str, df: Optional[pd.DataFrame] = None) -> None:
+        if self.records is None:
+            return
+
+        self.records.append(
+            dict(
+                source=self.source,
+                step=step,
+                seconds=perf_counter() - self.start,
+                rows=None if df is None else len(df),
+                peak_rss_mb=peak_rss_mb(),
+            )
+        )
+
+        # Exclude the time taken to record from the next step
+        self.start = perf_counter()
+
+
+def _check(df: pd.DataFrame, dataflow_id: Optional[str], validate: bool) -> None:
+    """Check `df` for missing values and, if `validate`, invalid keys.
+
+    Helper for :func:`process`.
+    """
     rows = df.isna().any(axis=1)
     if rows.any():
         log.error(f"Incomplete; missing values in {rows.sum()} rows:")
@@ -339,13 +608,224 @@ def process(id: Union[int, str]) -> pd.DataFrame:
         print(df[rows].head(1).transpose())
         raise RuntimeError
 
-    # Save the result to cache
-    cache_results(id_str, df)
+    if validate:
+        _validate(df, dataflow_id)
 
-    # Return the data for use by other code
+
+def _validate(df: pd.DataFrame, dataflow_id: Optional[str]) -> None:
+    """Check the keys of `df` against the structure for `dataflow_id`.
+
+    Helper for :func:`process`. If `dataflow_id` is :obj:`None`, the ``HISTORICAL``
+    structure is used.
+    """
+    dsd_id = dataflow_id or "HISTORICAL"
+    invalid = get_validator(dsd_id).validate(df)
+    if len(invalid):
+        msg = f"{len(invalid)} of {len(df)} observations have keys invalid for {dsd_id}"
+        log.error(f"{msg}:\n{invalid.head()}")
+        raise RuntimeError(msg)
+
+    log.info(f"All keys valid for {dsd_id}")
+
+
+def _from_cache(id_str: str, path: Path, fmt: str) -> pd.DataFrame:
+    """Return cached results for :func:`process`.
+
+    If output files in the format `fmt` do not exist, or were written from other cached
+    results than `path`, they are (re)written.
+    """
+    log.info(f"From cache at {path}")
+    df = pd.read_pickle(path)
+    try:
+        current = _output_key_path(id_str, fmt).read_text() == path.name
+    except FileNotFoundError:
+        current = False
+    if not (current and OUTPUT_PATH.joinpath(f"{id_str}-clean.{fmt}").exists()):
+        _cache_results(id_str, df, fmt, path)
     return df
 
 
+def _output_key_path(id_str: str, fmt: str) -> Path:
+    """Return the path of a file recording the source of output files for `id_str`.
+
+    The file contains the name of the cached results from :func:`process`, including
+    the :func:`cache_key`, from which the output files in format `fmt` were written.
+    """
+    return OUTPUT_PATH.joinpath("cache", f"{id_str}-clean.{fmt}.key")
+
+
+def _cache_results(id_str: str, df: pd.DataFrame, fmt: str, path: Path) -> None:
+    """Call :func:`cache_results` and record that `df` is from cached results `path`."""
+    cache_results(id_str, df, fmt)
+    _output_key_path(id_str, fmt).write_text(path.name)
+
+
+def process_many(
+    ids: Optional[Iterable[Union[int, str]]] = None, workers: int = 1, **kwargs
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, float]]:
+    """Process multiple data sets given their `ids`, optionally in parallel.
+
+    Each data set is processed using :func:`process`. With `workers` > 1, data sets are
+    processed in a pool of that many worker processes. Each worker generates the SDMX
+    data structures (:func:`.generate`) once, and reuses them for every data set it
+    processes.
+
+    Parameters
+    ----------
+    ids : iterable of int or str, optional
+        Data source ids. Duplicates are processed only once. If not given, all data
+        sets listed by :func:`source_ids` are processed.
+    workers : int, optional
+        Number of worker processes. If 1 (the default), data sets are processed one at
+        a time in the current process.
+    kwargs :
+        Passed to :func:`process`.
+
+    Returns
+    -------
+    dict of str → pandas.DataFrame
+        The processed data, keyed by the canonical ID from :func:`source_str`, in the
+        same order as `ids`.
+    dict of str → float
+        Wall time in seconds taken to process each data set.
+    """
+    # Canonical IDs, without duplicates, in order
+    id_strs = list(dict.fromkeys(map(source_str, source_ids() if ids is None else ids)))
+
+    func = partial(_process_timed, **kwargs)
+
+    results: Dict[str, Tuple[pd.DataFrame, float]] = dict()
+    if workers <= 1 or len(id_strs) <= 1:
+        for id_str in id_strs:
+            results[id_str] = _process_timed(id_str, **kwargs)
+    else:
+        # Pass the current paths to each worker; these are not preserved if the worker
+        # processes are spawned rather than forked
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(id_strs)),
+            initializer=_init_worker,
+            initargs=(dict(paths), OUTPUT_PATH),
+        ) as executor:
+            for id_str, result in zip(id_strs, executor.map(func, id_strs)):
+                results[id_str] = result
+
+    for id_str, (_, seconds) in results.items():
+        log.info(f"{id_str}: {seconds:.1f} s")
+
+    return (
+        {k: v[0] for k, v in results.items()},
+        {k: v[1] for k, v in results.items()},
+    )
+
+
+def _init_worker(worker_paths: Dict[str, Path], output_path: Path) -> None:
+    """Initialize a worker process for :func:`process_many`."""
+    global OUTPUT_PATH
+
+    paths.update(worker_paths)
+    OUTPUT_PATH = output_path
+
+    # Generate the data structures once for this process
+    generate()
+
+
+def _process_timed(id_str: str, **kwargs) -> Tuple[pd.DataFrame, float]:
+    """Call :func:`process` for `id_str`; return the data and the elapsed time."""
+    start = perf_counter()
+    df = process(id_str, **kwargs)
+    return df, perf_counter() - start
+
+
+#: Columns of the report from :func:`profile_many`.
+PROFILE_COLUMNS = ["source", "step", "seconds", "rows", "peak_rss_mb"]
+
+
+def profile_many(
+    ids: Optional[Iterable[Union[int, str]]] = None, workers: int = 1, **kwargs
+) -> pd.DataFrame:
+    """Process multiple data sets given their `ids`; return a profile of each step.
+
+    Each data set is processed with :func:`process`, recording the steps performed. By
+    default, `use_cache` is :obj:`False`, so every step is performed. With `workers` >
+    1, data sets are processed in a pool of that many worker processes, as by
+    :func:`process_many`.
+
+    Parameters
+    ----------
+    ids : iterable of int or str, optional
+        Data source ids. If not given, all data sets listed by :func:`source_ids` are
+        processed.
+    workers : int, optional
+        Number of worker processes.
+    kwargs :
+        Passed to :func:`process`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        with the :data:`PROFILE_COLUMNS`, and one row for each step of processing each
+        data set. “seconds” is the wall time taken by the step; “rows” is the length of
+        the data after the step, if any; and “peak_rss_mb” is the peak resident set size
+        of the (worker) process after the step. A last row with step “total” gives the
+        total time for each data set. See :func:`write_profile`.
+    """
+    id_strs = list(dict.fromkeys(map(source_str, source_ids() if ids is None else ids)))
+    kwargs.setdefault("use_cache", False)
+
+    func = partial(_profile, **kwargs)
+
+    if workers <= 1 or len(id_strs) <= 1:
+        results = list(map(func, id_strs))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(id_strs)),
+            initializer=_init_worker,
+            initargs=(dict(paths), OUTPUT_PATH),
+        ) as executor:
+            results = list(executor.map(func, id_strs))
+
+    return pd.DataFrame(
+        list(chain.from_iterable(results)), columns=PROFILE_COLUMNS
+    ).astype({"rows": "Int64"})
+
+
+def _profile(id_str: str, **kwargs) -> List[Dict[str, Any]]:
+    """Call :func:`process` for `id_str`; return the records of each step."""
+    records: List[Dict[str, Any]] = []
+    df = process(id_str, profile=records, **kwargs)
+
+    records.append(
+        dict(
+            source=id_str,
+            step="total",
+            seconds=sum(r["seconds"] for r in records),
+            rows=len(df),
+            peak_rss_mb=peak_rss_mb(),
+        )
+    )
+    return records
+
+
+def write_profile(report: pd.DataFrame, path: Path) -> None:
+    """Write a `report` from :func:`profile_many` to `path`.
+
+    The format is chosen using the suffix of `path`: either :file:`.csv`, or
+    :file:`.json` for a list of records.
+
+    Raises
+    ------
+    ValueError
+        for other suffixes.
+    """
+    path = Path(path)
+    if path.suffix == ".csv":
+        report.to_csv(path, index=False)
+    elif path.suffix == ".json":
+        report.to_json(path, orient="records", indent=2)
+    else:
+        raise ValueError(f"Cannot write profile to {path}; use .csv or .json")
+
+
 @lru_cache()
 def fill_values_for_dataflow(dataflow_id: Optional[str]) -> Dict[str, str]:
     """Return a dictionary of fill values for the data flow `dataflow_id`."""
@@ -393,6 +873,62 @@ def get_area_name_map() -> Dict[str, str]:
     }
 
 
+@lru_cache()
+def get_iso_index() -> Dict[str, str]:
+    """Return a mapping from lower-case country names to ISO 3166 alpha-3 codes.
+
+    The mapping gives the same results as :func:`iso_alpha_3` for every name it
+    contains. It merges, in order of precedence:
+
+    1. :data:`COUNTRY_NAME`.
+    2. The alpha-2, alpha-3, name, numeric, official_name, and common_name fields of
+       :data:`pycountry.countries`, then of :data:`pycountry.historic_countries`.
+    3. The names of codes in ``CL_AREA``; see :func:`get_area_name_map`.
+
+    The mapping is stored in the user cache directory, and loaded from there by later
+    calls, as long as :data:`COUNTRY_NAME`, the version of :mod:`pycountry`, and
+    :data:`.structure.base.VERSION` are unchanged.
+    """
+    from importlib.metadata import version
+
+    h = hashlib.blake2b(digest_size=8)
+    for value in (
+        json.dumps(COUNTRY_NAME, sort_keys=True),
+        version("pycountry"),
+        base.VERSION,
+    ):
+        h.update(value.encode())
+    key = h.hexdigest()
+
+    path = user_cache_path("item").joinpath("iso-alpha-3.json")
+    try:
+        data = json.loads(path.read_text())
+        assert key == data["key"]
+        return data["index"]
+    except (AssertionError, KeyError, OSError, ValueError):
+        log.info(f"Build {path}")
+
+    # Candidate names from pycountry; resolve each in the same way as iso_alpha_3()
+    fields = "alpha_2 alpha_3 name numeric official_name common_name".split()
+    pycountry_names = set()
+    for db in (pycountry.countries, pycountry.historic_countries):
+        for country in db:
+            for field in fields:
+                if candidate := getattr(country, field, None):
+                    pycountry_names.add(candidate.lower())
+
+    # Items added earlier take precedence over later items with the same name
+    result: Dict[str, str] = {}
+    for name in chain(COUNTRY_NAME, sorted(pycountry_names)):
+        result.setdefault(name, _pycountry_lookup(COUNTRY_NAME.get(name, name)))
+    for name, code in get_area_name_map().items():
+        result.setdefault(name, code)
+
+    write_atomic(path, json.dumps(dict(key=key, index=result)))
+
+    return result
+
+
 @lru_cache()
 def iso_alpha_3(name: str) -> str:
     """Return ISO 3166 alpha-3 code for a country `name`.
@@ -411,6 +947,19 @@ def iso_alpha_3(name: str) -> str:
     # Maybe map a known, non-standard value to a standard value
     name = COUNTRY_NAME.get(name.lower(), name)
 
+    try:
+        return _pycountry_lookup(name)
+    except LookupError:
+        pass
+
+    try:
+        return get_area_name_map()[name.lower()]
+    except KeyError:
+        raise LookupError(name)
+
+
+def _pycountry_lookup(name: str) -> str:
+    """Return the alpha-3 code for `name` from current or historic countries."""
     # Use pycountry's built-in, case-insensitive lookup on all fields including name,
     # official_name, and common_name
     for db in (pycountry.countries, pycountry.historic_countries):
@@ -418,35 +967,86 @@ def iso_alpha_3(name: str) -> str:
             return db.lookup(name).alpha_3
         except LookupError:
             continue
+    raise LookupError(name)
 
-    try:
-        return get_area_name_map()[name.lower()]
-    except KeyError:
-        raise LookupError(name)
+
+def iso_alpha_3_column(names: pd.Series) -> pd.Series:
+    """Return ISO 3166 alpha-3 codes for a series of country `names`.
+
+    Vectorized equivalent of ``names.apply(iso_alpha_3)``: each distinct name in
+    `names` is looked up once in :func:`get_iso_index`.
+
+    Raises
+    ------
+    LookupError
+        listing all the distinct names that could not be resolved.
+    """
+    # Integer codes for each element of `names`, and the distinct values
+    codes, uniques = pd.factorize(names, use_na_sentinel=False)
+
+    # Look up each of the distinct values
+    result = pd.Index(uniques).astype(str).str.lower().map(get_iso_index())
+
+    missing = result.isna()
+    if missing.any():
+        raise LookupError(
+            f"{missing.sum()} unrecognized country name(s): {list(uniques[missing])}"
+        )
+
+    return pd.Series(result.take(codes), index=names.index, name=names.name)
 
 
-@lru_cache()
 def get_item_region(code: str) -> str:
-    """Return iTEM region for a country's ISO 3166 alpha-3 `code`, or “N/A”."""
-    from item.model.structure import get_cl_region
+    """Return iTEM region for a country's ISO 3166 alpha-3 `code`, or “N/A”.
 
-    for region_code in get_cl_region():
-        if code in region_code.child:
-            return region_code.id
+    See also
+    --------
+    .model.get_region_map
+    """
+    from item.model import get_region_map
 
-    return "N/A"
+    return get_region_map("item").get(code, "N/A")
 
 
-@lru_cache()
 def get_country_name(code: str) -> str:
-    """Return the country name for a country's ISO 3166 alpha-3 `code`."""
+    """Return the country name for a country's ISO 3166 alpha-3 `code`.
+
+    Raises
+    ------
+    KeyError
+        if `code` is not in :func:`get_country_name_map`.
+    """
+    return get_country_name_map()[code]
+
+
+@lru_cache()
+def get_country_name_map() -> Dict[str, str]:
+    """Return a mapping from ISO 3166 alpha-3 codes to country names.
+
+    The mapping includes current and historic countries from :mod:`pycountry`, plus the
+    area codes (like "B0") and names in ``CL_AREA``.
+    """
+    result: Dict[str, str] = {}
     for db in (pycountry.countries, pycountry.historic_countries):
-        if match := db.get(alpha_3=code):
-            return match.name
+        for country in db:
+            result.setdefault(country.alpha_3, country.name)
 
-    # Possibly an area code like "B0"
-    sm = generate()
-    return sm.codelist["CL_AREA"][code].name.localized_default()
+    for code in generate().codelist["CL_AREA"]:
+        result.setdefault(code.id, code.name.localized_default())
+
+    return result
+
+
+def source_ids() -> List[str]:
+    """Return the IDs of all data sources that have a processing module.
+
+    These are the submodules of :mod:`item.historical` with names like :mod:`.T001`.
+    """
+    return sorted(
+        info.name
+        for info in iter_modules(__path__)
+        if re.fullmatch(r"T\d{3}", info.name)
+    )
 
 
 def source_str(id: Union[int, str]) -> str:
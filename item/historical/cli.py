@@ -1,27 +1,147 @@
+import re
+from pathlib import Path
+
 import click
 from click import Group
 
-from . import fetch_source
+from . import FORMATS
 from .legacy import main as _phase1
 
 historical = Group("historical", help="Manipulate the historical database.")
 
 
+def _sources(ctx, param, value):
+    """Convert SOURCES like "1" or "T001" to canonical IDs."""
+    from . import source_str
+
+    result = []
+    for v in value:
+        if not re.fullmatch(r"T?\d{1,3}", v, flags=re.IGNORECASE):
+            raise click.BadParameter(f"{v!r} is not like 1 or T001")
+        result.append(source_str(int(v.lstrip("Tt"))))
+    return result
+
+
 @historical.command()
 @click.argument("output_path", type=click.Path(file_okay=False, writable=True))
-def diagnostics(output_path):
+@click.option(
+    "-j", "--jobs", type=int, default=1, help="Number of data sets to process at once."
+)
+def diagnostics(output_path, jobs):
     """Generate diagnostics on the historical input data sets."""
     from .diagnostic import run_all
 
-    run_all(output_path)
+    run_all(output_path, workers=jobs)
 
 
 @historical.command()
-@click.argument("source", type=int)
-def fetch(source):
-    """Retrieve raw data for SOURCE."""
-    path = fetch_source(source)
-    print(f"Retrieved {path}")
+@click.argument("sources", nargs=-1, callback=_sources)
+@click.option("--all", "all_", is_flag=True, help="Fetch all data sources.")
+@click.option(
+    "-j", "--jobs", type=int, default=4, help="Number of sources to fetch at once."
+)
+@click.option(
+    "--use-cache/--no-cache",
+    is_flag=True,
+    default=True,
+    help="Use cached files (no network traffic).",
+)
+def fetch(sources, all_, jobs, use_cache):
+    """Retrieve raw data for one or more SOURCES."""
+    from . import fetch_many
+
+    if all_ == bool(len(sources)):
+        raise click.UsageError("Give either SOURCES or --all")
+
+    results, errors = fetch_many(
+        None if all_ else sources, workers=jobs, use_cache=use_cache
+    )
+
+    for id_str, path in results.items():
+        print(f"Retrieved {path}")
+
+    if errors:
+        raise click.ClickException(f"Failed to fetch: {' '.join(errors)}")
+
+
+@historical.command("process")
+@click.argument("sources", nargs=-1, callback=_sources)
+@click.option("--all", "all_", is_flag=True, help="Process all data sources.")
+@click.option(
+    "-j", "--jobs", type=int, default=1, help="Number of data sets to process at once."
+)
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(FORMATS),
+    default="csv",
+    help="File format for cleaned data.",
+)
+@click.option(
+    "--validate",
+    is_flag=True,
+    help="Check keys against the iTEM code lists and constraints.",
+)
+def process_cmd(sources, all_, jobs, fmt, validate):
+    """Process raw data for one or more SOURCES.
+
+    Cleaned data are written to the historical output directory.
+    """
+    from . import process_many
+
+    if all_ == bool(len(sources)):
+        raise click.UsageError("Give either SOURCES or --all")
+
+    _, timings = process_many(
+        None if all_ else sources, workers=jobs, fmt=fmt, validate=validate
+    )
+
+    for id_str, seconds in timings.items():
+        print(f"{id_str}: {seconds:.1f} s")
+
+
+@historical.command()
+@click.argument("sources", nargs=-1, callback=_sources)
+@click.option("--all", "all_", is_flag=True, help="Profile all data sources.")
+@click.option(
+    "-j", "--jobs", type=int, default=1, help="Number of data sets to process at once."
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="Write the report to this .csv or .json file.",
+)
+@click.option(
+    "--use-cache", is_flag=True, help="Use cached results of processing, if any."
+)
+def profile(sources, all_, jobs, output, use_cache):
+    """Profile processing of one or more SOURCES.
+
+    The time taken by each step of processing each source is printed, with the slowest
+    sources first.
+    """
+    import pandas as pd
+
+    from . import profile_many, write_profile
+
+    if all_ == bool(len(sources)):
+        raise click.UsageError("Give either SOURCES or --all")
+
+    if output and output.suffix not in (".csv", ".json"):
+        raise click.BadParameter("must end with .csv or .json", param_hint="--output")
+
+    report = profile_many(None if all_ else sources, workers=jobs, use_cache=use_cache)
+
+    if output:
+        write_profile(report, output)
+
+    # Seconds for each source and step, in the order of the steps
+    table = report.pivot(index="source", columns="step", values="seconds")
+    table = table[list(dict.fromkeys(report["step"]))].sort_values(
+        "total", ascending=False
+    )
+    with pd.option_context("display.width", None, "display.max_columns", None):
+        print(table.round(3).to_string(na_rep=""))
 
 
 @historical.command()
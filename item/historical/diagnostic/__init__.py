@@ -1,6 +1,7 @@
 """Diagnostics for historical data sets."""
 
 from importlib import import_module
+from itertools import chain
 from pathlib import Path
 
 import pandas as pd
@@ -77,8 +78,12 @@ def coverage(df, area="COUNTRY", measure="VARIABLE", period="TIME_PERIOD"):
     return result
 
 
-def run_all(output_path):
-    """Run all diagnostics."""
+def run_all(output_path, workers=1):
+    """Run all diagnostics.
+
+    Each data set used by the :data:`QUALITY` checks is processed once, using
+    :func:`.process_many` with up to `workers` processes.
+    """
     from zipfile import ZIP_DEFLATED, ZipFile
 
     from jinja2 import Template
@@ -106,19 +111,25 @@ def run_all(output_path):
         (output_path / filename).write_text(coverage(data))
 
     # Quality checks
-    from item.historical import process
+    from item.historical import process_many
+
+    check_modules = [
+        import_module(f"item.historical.diagnostic.{check}") for check in QUALITY
+    ]
 
-    for check in QUALITY:
-        # Import
-        check_module = import_module(f"item.historical.diagnostic.{check}")
+    # Process all the inputs to the checks
+    processed, _ = process_many(
+        chain(*[m.ARGS for m in check_modules]), workers=workers
+    )
 
+    for check, check_module in zip(QUALITY, check_modules):
         # Output filename
         filename = f"{check}.csv"
         groups["Quality"].append(filename)
         data_files.append(output_path / filename)
 
-        # Generate inputs
-        inputs = [process(arg) for arg in check_module.ARGS]
+        # Retrieve inputs
+        inputs = [processed[arg] for arg in check_module.ARGS]
 
         # Compute and save
         check_module.compute(*inputs).to_csv(data_files[-1])
@@ -1,12 +1,18 @@
-import errno
-import os
-import pickle
+import json
+import logging
 from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
 from importlib import import_module
+from logging import ERROR
 from os import makedirs
 from os.path import join
-from typing import TYPE_CHECKING
+from pathlib import Path
+from time import perf_counter
+from types import ModuleType
+from typing import TYPE_CHECKING, Union
 
+import numpy as np
 import pandas as pd
 import pycountry
 import sdmx.model.common
@@ -14,9 +20,18 @@ import xarray as xr
 import yaml
 
 from item.common import log, paths
-from item.model.common import as_xarray, concat_versions, select, tidy, to_wide
-from item.model.dimensions import INDEX, load_template
-from item.util import metadata_repo_file
+from item.model.common import (
+    _is_dask,
+    _parse_dims,
+    as_xarray,
+    concat_versions,
+    iter_long,
+    select,
+    tidy,
+    to_wide,
+)
+from item.model.dimensions import INDEX
+from item.util import dir_hash, file_hash, metadata_repo_file, package_version
 
 from . import structure
 
@@ -30,6 +45,8 @@ __all__ = [
     "concat_versions",
     "coverage",
     "get_model_info",
+    "get_region_map",
+    "get_scenario_map",
     "load_model_data",
     "load_model_scenarios",
     "make_regions_csv",
@@ -62,64 +79,48 @@ SUBMODULES = [
 ]
 
 
-def coverage(models):
-    """Display some basic data coverage information."""
+def coverage(data):
+    """Return basic data coverage information for *data*.
 
-    log("Checking data coverage.\n")
+    A series—a combination of model, variable, mode, technology, and fuel—is considered
+    populated if it has a value for *any* scenario, region, and year.
 
-    # Accumulate a list of xr.DataArrays to later concatenate@
-    result = []
-
-    # Load the list of requested quantities
-    qty = load_template(paths["model data"])
-
-    # Find True/not-null values and sum to get the number of requested
-    # quantities for each variable
-    req = qty.notnull().sum(["Mode", "Technology", "Fuel"]).to_array(name="Requested")
-    log("Quantities requested in reporting template: %d\n", req.sum())
-    result.append((req, "Requested"))
-
-    # Iterate through models
-    for name in sorted(models.keys()):
-        if name == "itf" or name == "exxonmobil" or name == "roadmap":
-            # Skip due to a data issue
-            continue
-        log("Loading data for %s" % name)
-
-        # Load model data
-        df = pd.read_csv(os.path.join(paths["model data"], "model", name, "data.csv"))
-        log(df.head())
-
-        # Convert to an xr.Dataset, then count non-null values. We consider a
-        # series populated if it has a data value for *any* scenario, region
-        # and year.
-        counts = (
-            as_xarray(df)
-            .notnull()
-            .any(["Scenario", "Region", "Year"])
-            .sum(["Mode", "Technology", "Fuel"])
-            .to_array()
-        )
-        result.append((counts, name))
+    Parameters
+    ----------
+    data : pandas.DataFrame or dask.dataframe.DataFrame
+        Data in long format, for instance from :func:`load_model_data`. With a
+        :mod:`dask` DataFrame (``lazy=True``), the data is not loaded into memory
+        all at once.
 
-    # Make two separate lists of the DataArrays and labels
-    data, labels = zip(*result)
+    Returns
+    -------
+    pandas.DataFrame
+        with one row per variable, plus a “Total” row; one column per model with the
+        number of populated series, plus a “# of models” column with the number of
+        models with any populated series.
+    """
+    log("Checking data coverage.\n")
 
-    # Combine to a single Dataset
-    df = (
-        xr.concat(data, pd.Index(labels, name="model"))
-        .fillna(0)
-        .to_dataframe()
-        .unstack("model")
+    # Distinct, populated series
+    series = (
+        data[data["value"].notnull()][
+            ["model", "variable", "mode", "technology", "fuel"]
+        ]
+        .astype(str)
+        .drop_duplicates()
     )
+    if _is_dask(series):
+        series = series.compute()
+
+    df = series.groupby(["variable", "model"]).size().unstack("model", fill_value=0)
 
     # Compute some totals
-    df.columns = df.columns.droplevel(0)
-    df["# of models"] = (df.loc[:, "bp":] > 0).sum(axis="columns")
+    df["# of models"] = (df > 0).sum(axis="columns")
     df.loc["Total", :] = df.sum(axis="rows")
     df = df.astype(int)
     log(df)
-    df.to_csv(os.path.join(paths["model data"], "output", "coverage.csv"))
+
+    return df
 
 
 def get_model_info(name: str, version: int) -> "ModelInfo":
@@ -144,51 +145,189 @@ def get_model_names(version: int = VERSIONS[-1]) -> list[str]:
     return [m.id for m in MODELS.values() if version in m.versions]
 
 
-def process_raw(version, models):
+def process_raw(version, models, workers=1, force=False):
     """Process raw data submissions.
 
-    Data for MODELS are imported from the raw data directory.
+    Data for MODELS are imported from the raw data directory. With *workers* > 1,
+    models are processed in a pool of that many worker processes. Log messages for
+    each model are also written to :file:`process.log` in its processed data directory.
+    If processing fails for one model, the error is logged and other models are still
+    processed.
+
+    A model is skipped if its raw data file, metadata directory and importer are
+    unchanged since it was last processed, as recorded in :file:`manifest.json` in its
+    processed data directory. With *force* = :obj:`True`, all models are processed.
+
+    Returns
+    -------
+    dict of str → float
+        Wall time in seconds taken to process each model.
+    dict of str → Exception
+        Errors raised while processing any models.
     """
     # Process arguments
-    models = models if len(models) else get_model_names(version)
+    models = list(dict.fromkeys(models)) if len(models) else get_model_names(version)
 
     log("Processing raw data for: {}".format(" ".join(models)))
 
-    class _csv_model:
-        def import_data(self, data_path, metadata_path):
-            return pd.read_csv(data_path), None
+    timings: dict[str, float] = dict()
+    errors: dict[str, Exception] = dict()
 
-    for name in models:
-        try:
-            info = get_model_info(name, version)
-        except KeyError:
-            log("  unknown model '%s', skipping" % name)
-            continue
-
-        if info["format"] == "csv":
-            model = _csv_model()
-        elif info["format"] is None:
-            log("  model '{}' needs no import".format(name))
-            continue
-        else:
-            model = import_module("item.model.%s" % name)
+    if workers <= 1 or len(models) <= 1:
+        for name in models:
+            try:
+                timings[name] = _process_raw_timed(name, version, force)
+            except Exception as e:
+                errors[name] = e
+    else:
+        # Pass the current paths and models to each worker; these are not preserved if
+        # the worker processes are spawned rather than forked
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(models)),
+            initializer=_init_worker,
+            initargs=(dict(paths), dict(MODELS)),
+        ) as executor:
+            futures = {
+                name: executor.submit(_process_raw_timed, name, version, force)
+                for name in models
+            }
+            for name, future in futures.items():
+                try:
+                    timings[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+
+    # Summary
+    for name, seconds in timings.items():
+        log(f"  {name}: {seconds:.1f} s")
+    for name, error in errors.items():
+        log(f"  {name}: failed with {error!r}", level=ERROR)
+
+    return timings, errors
+
+
+def _init_worker(worker_paths: dict[str, Path], models: dict[str, "ModelInfo"]) -> None:
+    """Initialize a worker process for :func:`process_raw`."""
+    paths.update(worker_paths)
+    MODELS.update(models)
+
+
+class _CSVModel:
+    """Import raw data submitted in the iTEM CSV template."""
+
+    @staticmethod
+    def import_data(data_path, metadata_path):
+        return pd.read_csv(data_path), None
+
+
+def _process_raw_timed(name, version, force=False) -> float:
+    """Process raw data for model *name*; return the elapsed time.
+
+    Helper for :func:`process_raw`.
+    """
+    start = perf_counter()
+
+    try:
+        info = get_model_info(name, version)
+    except ValueError:
+        log("  unknown model '%s', skipping" % name)
+        return 0.0
+
+    model: Union[_CSVModel, ModuleType]
+    if info.format == "csv":
+        model = _CSVModel()
+    elif info.format is None:
+        log("  model '{}' needs no import".format(name))
+        return 0.0
+    else:
+        model = import_module("item.model.%s" % name)
+
+    model_dir = Path(paths["model processed"], str(version), name)
+    manifest_path = model_dir.joinpath("manifest.json")
+    manifest = _manifest(name, model, version, info)
+
+    if not force and _manifest_unchanged(manifest_path, manifest):
+        log(f"  model '{name}' is unchanged since last processed, skipping")
+        return perf_counter() - start
+
+    # Also write log messages for this model to a separate file
+    model_dir.mkdir(parents=True, exist_ok=True)
+    handler = logging.FileHandler(model_dir.joinpath("process.log"), mode="w")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger = logging.getLogger("item")
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(min(logger.getEffectiveLevel(), logging.INFO))
 
+    try:
         _process_raw(name, model, version, info)
+    except Exception as e:
+        log(f"{e!r}", level=ERROR)
+        manifest_path.unlink(missing_ok=True)
+        raise
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+        handler.close()
 
+    manifest_path.write_text(json.dumps(manifest, indent=2))
 
-def _process_raw(name, model, version, info):
-    log("Processing raw data for {}".format(name))
+    return perf_counter() - start
+
+
+def _raw_paths(name, version, info) -> tuple[Path, Path]:
+    """Return the paths to the raw data file and metadata directory for *name*."""
     # Path to raw data: this hold the contents of the Dropbox folder
     # 'ITEM2/Scenario_data_for_comparison/Data_submission_1/Raw_data'
-    raw_data = join(
-        paths["model raw"], str(version), "{}.{}".format(name, info["format"])
+    return (
+        Path(paths["model raw"], str(version), f"{name}.{info.format}"),
+        Path(paths["data"], "model", name),
     )
-    metadata = join(paths["data"], "model", name)
+
+
+def _manifest(name, model, version, info) -> dict:
+    """Describe the inputs used to process raw data for model *name*.
+
+    If the raw data file does not exist, its hash is :obj:`None`.
+    """
+    raw_data, metadata = _raw_paths(name, version, info)
+    importer = getattr(model, "__file__", __file__)
+
+    return dict(
+        raw_data=str(raw_data),
+        raw_data_hash=file_hash(raw_data) if raw_data.exists() else None,
+        metadata_hash=dir_hash(metadata),
+        importer_hash=file_hash(importer),
+        item_version=package_version(),
+    )
+
+
+def _manifest_unchanged(path: Path, manifest: dict) -> bool:
+    """Return :obj:`True` if *manifest* matches the one stored at *path*.
+
+    A manifest without a raw data hash never matches, nor does any if the processed
+    data file is missing.
+    """
+    try:
+        existing = json.loads(path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+
+    return (
+        manifest["raw_data_hash"] is not None
+        and path.parent.with_suffix(".csv").exists()
+        and existing == manifest
+    )
+
+
+def _process_raw(name, model, version, info):
+    log("Processing raw data for {}".format(name))
+    raw_data, metadata = _raw_paths(name, version, info)
 
     log("  raw data: {}\n  metadata: {}".format(raw_data, metadata))
 
     # Load the data
-    data, notes = model.import_data(raw_data, metadata)
+    data, notes = model.import_data(str(raw_data), str(metadata))
 
     # Put columns in a canonical order
     data = tidy(data)
@@ -202,9 +341,6 @@ def _process_raw(name, model, version, info):
     model_dir = join(paths["model processed"], str(version), name)
     makedirs(model_dir, exist_ok=True)
 
-    # TODO log the last-changed date of the file used for import, or a
-    # checksum
-
     # Write data
     data.to_csv(
         join(paths["model processed"], str(version), "%s.csv" % name), index=False
@@ -223,10 +359,72 @@ def _process_raw(name, model, version, info):
         pass
 
 
+@cache
+def get_region_map(name: str = "item", version: int = VERSIONS[-1]) -> dict[str, str]:
+    """Return a mapping from ISO 3166 alpha-3 codes to the regions of model *name*.
+
+    The mapping is constructed once from the code list given by
+    :func:`load_model_regions`, and cached. If a country appears in more than one
+    region, the last region is used. With *name* “item”, the iTEM regions are used.
+    """
+    result: dict[str, str] = {}
+    for region in load_model_regions(name, version):
+        result.update({c.id: region.id for c in region.child})
+    return result
+
+
+@cache
+def get_scenario_map(version: int = VERSIONS[-1]) -> dict[tuple[str, str], str]:
+    """Return a mapping from (model, scenario) to scenario category for *version*.
+
+    The mapping is constructed once from :func:`load_model_scenarios` for every model
+    in :func:`get_model_names`, and cached. Because the keys include the model, the
+    same scenario name may have different categories for different models.
+    """
+    return {
+        (model, scenario): info["category"]
+        for model in get_model_names(version)
+        for scenario, info in load_model_scenarios(model, version).items()
+    }
+
+
 def load_model_data(
-    version, skip_cache=False, cache=True, fmt=pd.DataFrame, options=[]
+    version,
+    skip_cache=False,
+    cache=True,
+    fmt=pd.DataFrame,
+    options=[],
+    sparse=False,
+    lazy=False,
+    **selectors,
 ):
-    """Load model database"""
+    """Load model database.
+
+    The data is read from :file:`{version}.csv` in the ``model database`` path and
+    converted to long format. If *cache* is :obj:`True` and :mod:`pyarrow` is
+    installed, the result is stored in a columnar store (see :mod:`.model.store`), and
+    later calls read from the store instead of the CSV file, unless *skip_cache* is
+    :obj:`True`. The store is not used if the CSV file or the :mod:`item` package
+    changes.
+
+    Parameters
+    ----------
+    lazy : bool, optional
+        If :obj:`True`, return a :class:`dask.dataframe.DataFrame` with one partition
+        for each model, or :mod:`xarray` objects backed by :mod:`dask` arrays with one
+        chunk for each model. Data is only read from the store when computed. The store
+        is written first, if needed, regardless of *cache*. Requires :mod:`dask` and
+        :mod:`pyarrow`.
+    sparse : bool, optional
+        If :obj:`True` and `fmt` is :class:`xarray.Dataset` or
+        :class:`xarray.DataArray`, return arrays backed by :class:`sparse.COO`; see
+        :func:`.as_xarray`.
+    selectors :
+        Keyword arguments to :func:`.select`, e.g. ``model="bp", variable="energy"``.
+        When reading from the store, only the matching data is read.
+    """
+    from . import store
+
     # Check arguments
     version = int(version)
 
@@ -239,30 +437,9 @@ def load_model_data(
         raise ValueError("unknown return format: %s" % fmt)
 
     # Path for cached data
-    cache_path = os.path.join(paths["cache"], "model-%d.pkl" % version)
-
-    data = None
-
-    # Read data from cache
-    if not skip_cache:
-        try:
-            with open(cache_path, "rb") as f:
-                data = pickle.load(f)
-        except OSError as e:
-            if e.errno == errno.ENOENT:  # No such file or directory
-                pass
+    store_path = store.store_path(version, path)
 
-    # Read data from file
-    if data is None:
-        data = tidy(pd.read_csv(path))
-
-        # Convert to long format, drop empty rows
-        data = pd.melt(data, id_vars=INDEX, var_name="year").dropna(subset=["value"])
-
-        # Cache the result
-        if cache:
-            with open(cache_path, "wb") as f:
-                pickle.dump(data, f)
+    data = _load(path, store_path, skip_cache, cache, lazy, selectors)
 
     # Optional additional processing
     if "squash scenarios" in options:
@@ -274,12 +451,47 @@ def load_model_data(
 
     if fmt in [xr.Dataset, xr.DataArray]:
         # Convert to an xarray format
-        return as_xarray(data, version, fmt)
+        return as_xarray(data, version, fmt, sparse=sparse)
     else:
         # return as-is
         return data
 
 
+def _load(path, store_path, skip_cache, cache, lazy, selectors):
+    """Load model data from `path` or `store_path`; helper for :func:`load_model_data`.
+
+    `path` is read in chunks with :func:`.iter_long`, so the wide-format file is never
+    in memory as a whole.
+    """
+    from . import store
+
+    if lazy:
+        # Write the store if needed, then read from it
+        if skip_cache or not store_path.is_dir():
+            store.write_store(iter_long(path), store_path)
+        return store.read_store_lazy(store_path, **_parse_dims(**selectors))
+
+    if not skip_cache and store_path.is_dir():
+        # Read data from cache
+        try:
+            return select(store_path, **selectors)
+        except ImportError:
+            pass  # pyarrow not installed
+
+    if cache:
+        # Stream the data from file to the store, then read from there
+        try:
+            store.write_store(iter_long(path), store_path)
+            return select(store_path, **selectors)
+        except ImportError:
+            log("Install pyarrow to cache model data")
+
+    # Read data from file, selecting from each chunk
+    return pd.concat(
+        [select(chunk, **selectors) for chunk in iter_long(path)], ignore_index=True
+    )
+
+
 def load_models_info() -> None:
     """Load the models metadata into the MODELS global."""
     global MODELS
@@ -359,15 +571,8 @@ def make_regions_csv(out_file, models=None, compare=None):
     models = models or get_model_names(version)
 
     def _load(name):
-        def _invert(codelist) -> dict[str, str]:
-            result = {}
-            for region in codelist:
-                result.update({c.id: region.id for c in region.child})
-            return result
-
         return pd.Series(
-            _invert(load_model_regions(name, version)),
-            name=name if len(name) else "item",
+            get_region_map(name, version), name=name if len(name) else "item"
         )
 
     result = pd.concat([_load(model) for model in ["item"] + models], axis=1)
@@ -426,13 +631,34 @@ def make_regions_yaml(in_file, country, region, out_file):
 def squash_scenarios(data, version):
     """Replace the per-model scenario names with scenario categories.
 
-    *data* is a pd.DataFrame. *version* is the version of the iTEM model
-    database.
+    *data* is a pd.DataFrame or dask.dataframe.DataFrame. *version* is the version of
+    the iTEM model database. Scenario names are looked up by model, using
+    :func:`get_scenario_map`; names not found are not changed. Each distinct
+    combination of model and scenario is looked up once, and only the “scenario”
+    column is recoded, keeping its dtype; other columns are not changed.
     """
-    # Construct the map from model metadata
-    scenarios_map = {}
-    for model in get_model_names(version):
-        for s, info in load_model_scenarios(model, version).items():
-            scenarios_map[s] = info["category"]
+    scenario_map = get_scenario_map(version)
 
-    return data.replace({"scenario": scenarios_map})
+    def _squash(df):
+        # Distinct (model, scenario) pairs, and the category for each
+        codes, pairs = pd.factorize(
+            pd.MultiIndex.from_arrays([df["model"], df["scenario"]])
+        )
+        category = [scenario_map.get((str(m), s), s) for m, s in pairs]
+        category_codes, categories = pd.factorize(pd.Index(category, dtype=object))
+
+        # Missing values (code -1) remain missing
+        scenario = pd.Series(
+            pd.Categorical.from_codes(
+                np.append(category_codes, -1)[codes], categories=categories
+            ),
+            index=df.index,
+        )
+        if not isinstance(df["scenario"].dtype, pd.CategoricalDtype):
+            scenario = scenario.astype(df["scenario"].dtype)
+        return df.assign(scenario=scenario)
+
+    if _is_dask(data):
+        return data.map_partitions(_squash, meta=data._meta)
+    else:
+        return _squash(data)
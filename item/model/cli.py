@@ -15,7 +15,39 @@ def add(fn, *params):
     )
 
 
-add(process_raw, Argument(["version"], type=int), Argument(["models"], nargs=-1))
+@model.command("process-raw")
+@click.argument("version", type=int)
+@click.argument("models", nargs=-1)
+@click.option(
+    "-j", "--jobs", type=int, default=1, help="Number of models to process at once."
+)
+@click.option(
+    "--force", is_flag=True, help="Process models even if their inputs are unchanged."
+)
+def process_raw_cmd(version, models, jobs, force):
+    """Process raw data submissions for VERSION and MODELS (default: all)."""
+    timings, errors = process_raw(version, models, workers=jobs, force=force)
+
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds:.1f} s")
+
+    if errors:
+        raise click.ClickException(
+            "Failed to process: "
+            + ", ".join(f"{name} ({e!r})" for name, e in errors.items())
+        )
+
+
+# Former name of the command
+model.add_command(
+    click.Command(
+        "process_raw",
+        callback=process_raw_cmd.callback,
+        params=process_raw_cmd.params,
+        help=process_raw_cmd.help,
+        hidden=True,
+    )
+)
 
 add(
     list_pairs,
@@ -3,6 +3,7 @@
 from dataclasses import dataclass, field
 from logging import DEBUG
 from os.path import join
+from pathlib import Path
 from typing import Optional
 
 import numpy as np
@@ -41,19 +42,199 @@ class ModelInfo:
     org_url: Optional[str] = None
 
 
-def as_xarray(data, version, fmt):
+def as_xarray(data, version, fmt, sparse=False):
+    """Convert long-format *data* to :mod:`xarray` objects.
+
+    Returns a :class:`dict` of :class:`xarray.DataArray`, one per variable, or if *fmt*
+    is :class:`xarray.Dataset`, these merged into a Dataset. Dimensions with only one
+    value for a variable are stored as attributes of its DataArray.
+
+    The index levels of *data* are factorized once. The coordinates of each variable
+    are found with grouped NumPy operations on the resulting codes, and the values are
+    scattered into arrays of the corresponding shape.
+
+    With *sparse* :obj:`True`, the arrays are backed by :class:`sparse.COO` arrays
+    built from the index codes, so that memory use is proportional to the number of
+    values rather than the product of the lengths of all dimensions. This requires the
+    :mod:`sparse` package.
+
+    *data* may also be a :class:`dask.dataframe.DataFrame`, for instance from
+    :func:`.load_model_data` with ``lazy=True``. Then only the labels are read to
+    determine the coordinates, and the arrays are backed by :mod:`dask` arrays with one
+    chunk for each model, so values are only read when computed.
+    """
+    if _is_dask(data):
+        das = _as_xarray_lazy(data, version, sparse)
+    else:
+        das = _as_xarray(data, version, sparse)
+
+    result = das
+
+    # The resulting dataset is very sparse
+    if fmt == xr.Dataset:
+        log("Merging\n  sparseness:", level=DEBUG)
+
+        result = xr.merge(das.values())
+
+        for v in result:
+            if _is_dask(result[v].data):
+                continue  # Counting would read all the data
+            fill = _fill(result[v])
+            log("  {:3.0f}% full — {}".format(fill, v), level=DEBUG)
+
+    return result
+
+
+def _as_xarray(data, version, sparse):
+    """Convert a :class:`pandas.DataFrame`; helper for :func:`as_xarray`."""
     # Columns to preserve as a multi-index
     data.set_index(INDEX + ["year"], inplace=True)
+    values = data["value"].to_numpy(dtype=float)
 
     # variable name → xr.DataArray
     das = {}
 
-    # Iterate over variables. Some variables (intensities) appear twice with
+    for name, rows, coords, attrs, positions in _iter_groups(data.index, version):
+        shape = tuple(coords.sizes.values())
+        d = xr.DataArray(
+            _scatter(values[rows], positions, shape, sparse),
+            coords=coords,
+            dims=list(coords.dims),
+            name=name,
+            attrs=attrs,
+        )
+
+        fill = 100 * np.count_nonzero(~np.isnan(values[rows])) / np.prod(shape)
+        log(
+            "  {:2.0f}% full\n  coords: {}\n  attrs: {}".format(
+                fill, ", ".join(d.coords.keys()), d.attrs
+            ),
+            level=DEBUG,
+        )
+
+        das[name] = d
+
+    return das
+
+
+def _as_xarray_lazy(data, version, sparse):
+    """Convert a :class:`dask.dataframe.DataFrame`; helper for :func:`as_xarray`."""
+    import dask
+    import dask.array
+
+    columns = INDEX + ["year"]
+
+    # Labels only, for each partition
+    labels = dask.compute(*data[columns].to_delayed())
+    index = _concat(labels).set_index(columns).index
+
+    # Partitions containing each model
+    parts = data.to_delayed()
+    parts_for = {}
+    for i, df in enumerate(labels):
+        for model in df["model"].unique():
+            parts_for.setdefault(model, []).append(parts[i])
+
+    # variable name → xr.DataArray
+    das = {}
+
+    for name, _, coords, attrs, _ in _iter_groups(index, version):
+        # Labels along each dimension of a chunk, which has only one model
+        dims = {d: None if d == "model" else coords[d].to_index() for d in coords.dims}
+        shape = tuple(1 if v is None else len(v) for v in dims.values())
+        models = coords["model"].values if "model" in dims else [attrs["model"]]
+        empty = [np.array([], dtype=int)] * len(shape)
+        meta = _scatter(np.array([]), empty, (0,) * len(shape), sparse)
+
+        blocks = [
+            dask.array.from_delayed(
+                dask.delayed(_lazy_block)(
+                    parts_for[m], m, attrs["variable"], attrs["unit"], dims, sparse
+                ),
+                shape,
+                dtype=float,
+                meta=meta,
+            )
+            for m in models
+        ]
+        array = (
+            dask.array.concatenate(blocks, axis=list(coords.dims).index("model"))
+            if "model" in coords.dims
+            else blocks[0]
+        )
+        das[name] = xr.DataArray(
+            array, coords=coords, dims=list(coords.dims), name=name, attrs=attrs
+        )
+
+    return das
+
+
+def _lazy_block(parts, model, variable, unit, dims, sparse):
+    """Return an array with the values for `variable` and one `model` from `parts`.
+
+    Helper for :func:`_as_xarray_lazy`. `dims` gives the labels along each dimension,
+    or :obj:`None` for "model", which has length 1.
+    """
+    df = pd.concat(
+        p[(p["model"] == model) & (p["variable"] == variable) & (p["unit"] == unit)]
+        for p in parts
+    )
+    positions = [
+        np.zeros(len(df), dtype=int) if labels is None else labels.get_indexer(df[d])
+        for d, labels in dims.items()
+    ]
+    # Rows with missing labels, i.e. position -1, are omitted as by _iter_groups()
+    keep = np.all([p >= 0 for p in positions], axis=0) if positions else slice(None)
+    positions = [p[keep] for p in positions]
+    shape = tuple(1 if labels is None else len(labels) for labels in dims.values())
+    return _scatter(df["value"].to_numpy(dtype=float)[keep], positions, shape, sparse)
+
+
+def _iter_groups(index, version):
+    """Iterate over variables in `index`; helper for :func:`as_xarray`.
+
+    Yields
+    ------
+    tuple
+        Name of the variable; row numbers for its data in `index`; its
+        :class:`xarray.Coordinates`; attributes, including dimensions with a single
+        label; and the positions of each of the rows along each dimension.
+    """
+    if len(index) == 0:
+        return
+
+    # Group rows by variable and unit. Some variables (intensities) appear twice with
     # different units for freight, passenger
-    for key, d in data.groupby(level=["variable", "unit"]):
-        variable, unit = key
+    iv, iu = index.names.index("variable"), index.names.index("unit")
+    key = index.codes[iv].astype(np.int64) * len(index.levels[iu]) + index.codes[iu]
+    # Rows with a missing label in any level, i.e. code -1, are not converted
+    key[(np.stack(index.codes) < 0).any(axis=0)] = -1
+    order = np.argsort(key, kind="stable")
+    groups, bounds = np.unique(key[order], return_index=True)
+    bounds = np.append(bounds, len(order))
+    if len(groups) and groups[0] == -1:
+        # Rows with missing labels
+        groups, bounds = groups[1:], bounds[1:]
+
+    # Rows with duplicate labels; these cannot be converted
+    duplicated = index.duplicated(keep=False)
+
+    # For each index level, the codes used by each group
+    used = [_group_codes(key, codes, groups) for codes in index.codes]
+
+    # (dimension, codes) → coordinate variable and index. Many variables have the same
+    # coordinates, so these are created once and shared.
+    cache: dict = {}
+
+    for g in range(len(groups)):
+        rows = order[bounds[g] : bounds[g + 1]]
+        variable = index.levels[iv][index.codes[iv][rows[0]]]
+        unit = index.levels[iu][index.codes[iu][rows[0]]]
 
-        log("Variable: {0[0]} [{0[1]}]\n  {1} values".format(key, len(d)), level=DEBUG)
+        log(
+            "Variable: {} [{}]\n  {} values".format(variable, unit, len(rows)),
+            level=DEBUG,
+        )
 
         # Version-specific fixes
         # TODO move
@@ -64,58 +245,94 @@ def as_xarray(data, version, fmt):
             elif variable in ["ef_co2 (service)", "intensity_service"]:
                 variable = variable.replace("service", unit[-3:])
 
-        # *d* (the data for this variable) has all the MultiIndex levels of
-        # *data*; drop the unused ones (requires pandas 0.20)
-        d.index = d.index.remove_unused_levels()
+        if duplicated[rows].any():
+            log(index[rows][duplicated[rows]].to_series(), level=DEBUG)
+            raise ValueError(
+                "cannot convert a DataFrame with a non-unique MultiIndex into xarray"
+            )
 
-        # Convert to xr.DataArray
-        try:
-            d = xr.DataArray.from_series(d["value"].astype(float))
-        except Exception as e:
-            if "non-unique multi-index" in str(e):
-                log(d.index[d.index.duplicated()].to_series(), level=DEBUG)
-            raise
-
-        # Convert unused dimensions for this variable to attributes
-        squeeze_dims = []
-        for c in d.coords:
-            if d.sizes[c] == 1:
-                # Dimension 'c' has only one value → convert
-                d.attrs[c] = d[c].values[0]
-                squeeze_dims.append(c)
-        d = d.squeeze(squeeze_dims, drop=True)
-        d.name = variable
-        d.attrs["unit"] = unit
-
-        fill = float(100 * d.notnull().sum() / np.prod(list(d.sizes.values())))
-        log(
-            "  {:2.0f}% full\n  coords: {}\n  attrs: {}".format(
-                fill, ", ".join(d.coords.keys()), d.attrs
-            ),
-            level=DEBUG,
-        )
+        # Dimensions with one value for this variable become attributes
+        variables, indexes, attrs, positions = _coords(index, used, g, rows, cache)
+        attrs["unit"] = unit
 
-        das[variable] = d
+        yield variable, rows, xr.Coordinates(variables, indexes), attrs, positions
 
-    result = das
 
-    # The resulting dataset is very sparse
-    if fmt == xr.Dataset:
-        log("Merging\n  sparseness:", level=DEBUG)
+def _group_codes(key, codes, groups):
+    """Return the distinct `codes` in each of `groups` of rows, identified by `key`.
 
-        result = xr.merge(das.values())
+    Returns a list with one sorted array of codes for each element of `groups`.
+    """
+    n = int(codes.max()) + 2
+    g, c = np.divmod(np.unique(key[key >= 0] * n + codes[key >= 0] + 1), n)
+    return np.split(c - 1, np.searchsorted(g, groups[1:]))
 
-        for v in result:
-            fill = float(
-                100
-                * result[v].notnull().sum()
-                / np.prod(list(result[v].sizes.values()))
-            )
-            log("  {:3.0f}% full — {}".format(fill, v), level=DEBUG)
 
+def _coords(index, used, g, rows, cache):
+    """Return coordinates, attributes, and positions of `rows` for group `g`.
+
+    Helper for :func:`as_xarray`.
+    """
+    variables, indexes, attrs, positions = {}, {}, {}, []
+    for name, level, codes, u in zip(index.names, index.levels, index.codes, used):
+        u = u[g]
+        if len(u) == 1:
+            attrs[name] = level[u[0]]
+            continue
+        try:
+            c = cache[name, u.tobytes()]
+        except KeyError:
+            idx = level.take(u)
+            if isinstance(level, pd.CategoricalIndex):
+                idx = idx.remove_unused_categories()
+            c = cache[name, u.tobytes()] = xr.Coordinates({name: idx})
+        variables[name], indexes[name] = c.variables[name], c.xindexes[name]
+        positions.append(np.searchsorted(u, codes[rows]))
+    return variables, indexes, attrs, positions
+
+
+def _scatter(values, positions, shape, sparse):
+    """Return an array of `shape` with `values` at `positions`; elsewhere NaN."""
+    if sparse and positions:
+        import sparse as _sparse
+
+        return _sparse.COO(np.array(positions), values, shape=shape, fill_value=np.nan)
+
+    result = np.full(shape, np.nan)
+    if positions:
+        result[tuple(positions)] = values
+    elif len(values):
+        result[()] = values[0]
+    return result
+
+
+def _concat(dfs):
+    """Concatenate `dfs`, preserving categorical columns with different categories."""
+    result = pd.concat(dfs, ignore_index=True)
+    for name, dtype in dfs[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            result[name] = pd.api.types.union_categoricals(
+                [df[name] for df in dfs], ignore_order=True
+            )
     return result
 
 
+def _is_dask(obj) -> bool:
+    """Return :obj:`True` if `obj` is a :mod:`dask` collection."""
+    return type(obj).__module__.partition(".")[0] == "dask"
+
+
+def _fill(da):
+    """Return the percentage of non-missing values in `da`."""
+    size = np.prod(list(da.sizes.values()))
+    if hasattr(da.data, "nnz"):
+        # sparse.COO: count stored, non-missing values without densifying
+        count = np.count_nonzero(~np.isnan(da.data.data))
+    else:
+        count = int(da.notnull().sum())
+    return float(100 * count / size)
+
+
 def concat_versions(dataframes={}):
     """Convert a dict of *dataframes* to a single pd.DataFrame.
 
@@ -198,11 +415,41 @@ def tidy(df):
             return colname.lower()
 
     df.rename(columns=_rename, inplace=True)
-    return drop_empty(df.reindex_axis(INDEX + data_columns(df), axis=1))
+    return drop_empty(df.reindex(columns=INDEX + data_columns(df)))
 
 
-def select(data, *args, **kwargs):
-    """Select from *data*."""
+def iter_long(path, chunksize=20_000):
+    """Read wide-format model data from *path*, in chunks of *chunksize* rows.
+
+    Each chunk is processed with :func:`tidy` and converted to long format, without
+    empty values, so that only one chunk of the file is in memory at a time.
+
+    Yields
+    ------
+    pandas.DataFrame
+        with columns :data:`.INDEX`, “year”, and “value”. The :data:`.INDEX` columns
+        are categorical, and “year” is integer, as in the store (see
+        :mod:`.model.store`).
+    """
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        # Categorical dimensions are repeated by melt() as integer codes, not strings
+        chunk = tidy(chunk).astype({c: "category" for c in INDEX})
+        yield (
+            pd.melt(chunk, id_vars=INDEX, var_name="year")
+            .dropna(subset=["value"])
+            .astype({"year": "int64"})
+        )
+
+
+def _parse_dims(*args, **kwargs) -> dict[str, set]:
+    """Parse the arguments to :func:`select`.
+
+    Returns
+    -------
+    dict
+        Keys are dimension names, e.g. "technology" for the keyword argument "tech";
+        values are sets of values to select. Dimensions with no selection are omitted.
+    """
     # Process arguments
     if len(args) > 1:
         raise ValueError(
@@ -211,7 +458,7 @@ def select(data, *args, **kwargs):
             )
         )
 
-    dims = {k: None for k in INDEX}
+    dims: dict[str, Optional[set]] = {k: None for k in INDEX}
 
     for d, v in kwargs.items():
         d = "technology" if d == "tech" else d
@@ -225,27 +472,100 @@ def select(data, *args, **kwargs):
     if len(args) and dims["variable"] is None:
         dims["variable"] = set(args)
 
+    return {d: v for d, v in dims.items() if v is not None}
+
+
+def select(data, *args, **kwargs):
+    """Select from *data*.
+
+    The positional argument, if any, gives the variable(s) to select. Keyword arguments
+    give values to select for other dimensions. For example::
+
+        select(data, "energy", tech="All", fuel="All", mode=PAX)
+
+    *data* may be:
+
+    - a :class:`pandas.DataFrame` or :class:`dask.dataframe.DataFrame`.
+    - the path to a store written by :func:`.store.write_store`. The selection is
+      applied while reading, so only the matching data is loaded.
+    - a :class:`xarray.Dataset` or :class:`dict` of :class:`xarray.DataArray`, as
+      returned by :func:`as_xarray`. Data variables or dict entries are selected by
+      name for the “variable” dimension, by their attributes for dimensions that
+      :func:`as_xarray` converted to attributes, and by label for other dimensions.
+      Variables with no matching data are omitted. Data is not loaded, so selection
+      is lazy if the arrays are backed by :mod:`dask`.
+    """
+    dims = _parse_dims(*args, **kwargs)
+
     # Code to this point is generic (doesn't depend on the format of *data*)
 
-    if isinstance(data, xr.Dataset) or isinstance(data, dict):
-        # TODO write methods for these other data types
-        raise NotImplementedError
+    if isinstance(data, Path):
+        from .store import read_store
 
-    # pandas.DataFrame
+        return read_store(data, **dims)
+    elif isinstance(data, xr.Dataset):
+        selected = _select_xr(data.data_vars.items(), dims)
+        return xr.Dataset(selected, attrs=data.attrs)
+    elif isinstance(data, dict):
+        return _select_xr(data.items(), dims)
+
+    # pandas.DataFrame or dask.dataframe.DataFrame
     # Construct a boolean mask
     keep = None
     for d, v in dims.items():
-        if v is None:
-            continue
-        elif keep is None:
-            keep = data[d].isin(v)
-        else:
-            keep &= data[d].isin(v)
+        if pd.api.types.is_numeric_dtype(data[d].dtype):
+            # Values like "2010" select the same rows as when reading from a store
+            v = pd.to_numeric(pd.Series(list(v), dtype=object), errors="coerce")
+        mask = data[d].isin(list(v))
+        keep = mask if keep is None else keep & mask
 
     # Subset the data and return
-    return data[keep].copy()
+    return (data if keep is None else data[keep]).copy()
+
+
+def _select_xr(items, dims: dict[str, set]) -> dict[str, xr.DataArray]:
+    """Apply :func:`select` to (name, :class:`xarray.DataArray`) `items`."""
+    result = {}
+    for name, da in items:
+        indexers = {}
+        for d, values in dims.items():
+            if d == "variable":
+                keep = name in values
+            elif d in da.dims:
+                # Integer positions of matching labels; the index is always in memory
+                indexers[d] = np.flatnonzero(da.indexes[d].isin(list(values)))
+                keep = len(indexers[d]) > 0
+            else:
+                # Dimension with a single value, stored as an attribute
+                keep = d not in da.attrs or da.attrs[d] in values
+
+            if not keep:
+                break
+        else:
+            result[name] = da.isel(indexers)
+
+    return result
 
 
 def to_wide(data, dimension="year"):
-    """Convert *data* to wide format, one column per year."""
-    return data.set_index(INDEX + ["year"])["value"].unstack(dimension)
+    """Convert *data* to wide format, one column per year.
+
+    If *data* is a :class:`dask.dataframe.DataFrame`, the result is also, with the
+    other dimensions as columns instead of a :class:`pandas.MultiIndex`. Each partition
+    is converted separately, so all the data for each series must be in the same
+    partition; this is the case for data partitioned by model, as from
+    :func:`.load_model_data` with ``lazy=True``.
+    """
+    if not _is_dask(data):
+        return data.set_index(INDEX + ["year"])["value"].unstack(dimension)
+
+    # Labels along `dimension`, for the same columns in every partition
+    columns = sorted(data[dimension].unique().compute())
+    meta = _to_wide_partition(data._meta, dimension, columns)
+    return data.map_partitions(_to_wide_partition, dimension, columns, meta=meta)
+
+
+def _to_wide_partition(df, dimension, columns):
+    """Convert one partition of data; helper for :func:`to_wide`."""
+    result = to_wide(df, dimension).reindex(columns=columns).reset_index()
+    return result.astype({c: float for c in columns})
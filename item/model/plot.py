@@ -37,9 +37,13 @@ def plot_all_item1():
         This reproduces a figure from the (private) item2-scripts respository.
         """
 
-        variable = "energy"
-        selectors = dict(
-            region="Global", mode=PAX, tech=ALL, fuel=ALL, year=[2015, 2030, 2050]
+        select = dict(
+            variable="energy",
+            region="Global",
+            mode=PAX,
+            tech=ALL,
+            fuel=ALL,
+            year=[2015, 2030, 2050],
         )
         terms = [
             aes("year", "value / 1000", fill="mode"),
@@ -48,9 +52,10 @@ def plot_all_item1():
             labs(x="Year", y="EJ/year"),
         ]
 
-    df = load_model_data(1)
+    # Load only the data for this plot
+    df = load_model_data(1, **pass_energy_use_mode.select)
     df = squash_scenarios(df, 1)
-    pass_energy_use_mode(df, 1).save()
+    pass_energy_use_mode(df, 1)
 
 
 class Plot:
@@ -0,0 +1,215 @@
+"""Columnar cache for the model database."""
+
+import hashlib
+import logging
+import shutil
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Union
+from urllib.parse import unquote
+
+import pandas as pd
+
+from item.common import paths
+from item.model.dimensions import INDEX
+from item.util import atomic_path, file_hash, package_version
+
+log = logging.getLogger(__name__)
+
+#: Columns by which the store is partitioned. Each partition is a separate file, so
+#: reading data for some models or variables only reads the corresponding files.
+PARTITION = ["model", "variable"]
+
+#: All columns of data in the store, in order.
+COLUMNS = INDEX + ["year", "value"]
+
+
+def store_path(version: int, source: Union[Path, str]) -> Path:
+    """Return the path to the store for database `version`, read from `source`.
+
+    The directory name contains a hash of the contents of `source` and the version of
+    the :mod:`item` package, so that the store is not used if either changes.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    for value in (file_hash(source), package_version()):
+        h.update(value.encode())
+    return Path(paths["cache"], f"model-{version}-{h.hexdigest()}")
+
+
+def write_store(data: Union[pd.DataFrame, Iterable[pd.DataFrame]], path: Path) -> None:
+    """Write `data` to a store at `path`, partitioned by :data:`PARTITION`.
+
+    `data` is in long format, with :data:`COLUMNS`, or an iterable of chunks of such
+    data—for instance from :func:`.iter_long`. Chunks are written one at a time, so
+    only one is in memory. The dimension columns are stored as dictionary-encoded
+    (categorical) strings. The store is written to a temporary directory, which then
+    replaces any other store for the same database version.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Same schema for every chunk, regardless of its categories
+    schema = pa.schema(
+        [(c, pa.dictionary(pa.int32(), pa.string())) for c in INDEX]
+        + [("year", pa.int64()), ("value", pa.float64())]
+    )
+
+    with atomic_path(path) as tmp:
+        tmp.mkdir()
+
+        for i, chunk in enumerate([data] if isinstance(data, pd.DataFrame) else data):
+            chunk = chunk.astype(
+                {c: "category" for c in INDEX} | {"year": int, "value": float}
+            )
+            for c in INDEX:
+                chunk[c] = chunk[c].cat.rename_categories(str)
+
+            pq.write_to_dataset(
+                pa.Table.from_pandas(
+                    chunk[COLUMNS], schema=schema, preserve_index=False
+                ),
+                tmp,
+                partition_cols=PARTITION,
+                basename_template=f"part-{i}-{{i}}.parquet",
+                # Default is 1024; there may be more combinations of model and variable
+                max_partitions=2**16,
+            )
+
+        # Remove stores for the same database version from other source data or code,
+        # and pickled data from earlier versions of this package. Temporary
+        # directories, from this or other processes that are still writing, are not
+        # removed.
+        version = path.name.split("-")[1]
+        for other in path.parent.glob(f"model-{version}-*"):
+            if other.suffix != ".tmp":
+                shutil.rmtree(other, ignore_errors=True)
+        path.parent.joinpath(f"model-{version}.pkl").unlink(missing_ok=True)
+
+    log.info(f"Cached model data in {path}")
+
+
+def read_store(
+    path: Path, columns: Optional[Sequence[str]] = None, **dims: Iterable
+) -> Optional[pd.DataFrame]:
+    """Read data from the store at `path`.
+
+    Parameters
+    ----------
+    columns : list of str, optional
+        Columns to read. Default: all :data:`COLUMNS`.
+    dims :
+        Keys are names of :data:`COLUMNS`, e.g. "model" or "year"; values are
+        collections of values to select. Only the partitions for selected values of
+        :data:`PARTITION` are read, and only rows matching all `dims` are converted to
+        :class:`pandas.DataFrame`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        with `columns`; dimension columns are categorical. If there is no store at
+        `path`, :obj:`None`.
+
+    See also
+    --------
+    .model.common.select
+    """
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    if not path.is_dir():
+        return None
+
+    # Partition keys are categorical strings, even if they look like numbers
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=True)
+
+    # Selected values of the same types as the columns, e.g. "2010" → 2010 for "year"
+    schema = ds.dataset(path, partitioning=partitioning).schema
+    filters = [
+        (name, "in", _cast(values, schema.field(name).type))
+        for name, values in dims.items()
+    ]
+
+    table = pq.read_table(
+        path,
+        columns=list(columns or COLUMNS),
+        filters=filters or None,
+        partitioning=partitioning,
+    )
+    return table.to_pandas()
+
+
+def _cast(values: Iterable, type) -> list:
+    """Convert `values` to the :mod:`pyarrow` `type`; helper for :func:`read_store`.
+
+    Values that cannot be converted are omitted, since they match no data.
+    """
+    import pyarrow as pa
+
+    if pa.types.is_dictionary(type):
+        type = type.value_type
+
+    result = []
+    for value in values:
+        try:
+            result.append(pa.scalar(value).cast(type).as_py())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+    return result
+
+
+def _read_model(model: str, path: Path, dims: dict, columns=None) -> pd.DataFrame:
+    """Read the data for one `model`; helper for :func:`read_store_lazy`.
+
+    :mod:`dask` passes `columns`, so that only the columns that are used are read.
+    """
+    return read_store(path, columns, model=[model], **dims)
+
+
+def read_store_lazy(
+    path: Path, columns: Optional[Sequence[str]] = None, **dims: Iterable
+):
+    """Read data from the store at `path`, lazily.
+
+    Like :func:`read_store`, except data is only read when computed. Requires
+    :mod:`dask`.
+
+    Returns
+    -------
+    dask.dataframe.DataFrame
+        with one partition for each model. Dimension columns are categorical, with
+        categories that are not known until computed.
+    """
+    import dask.dataframe as dd
+    from dask.dataframe.utils import clear_known_categories
+
+    columns = list(columns or COLUMNS)
+    meta = clear_known_categories(
+        pd.DataFrame(
+            {
+                c: pd.Series(
+                    dtype={"year": "int64", "value": "float64"}.get(c, "category")
+                )
+                for c in columns
+            }
+        )
+    )
+
+    # Models in the store, or only those selected
+    selected = set(map(str, dims.pop("model", []))) or None
+    models = sorted(
+        m
+        for m in (unquote(p.name.partition("=")[2]) for p in path.glob("model=*"))
+        if selected is None or m in selected
+    )
+
+    if not models:
+        return dd.from_pandas(meta, npartitions=1)
+
+    return dd.from_map(
+        _read_model,
+        models,
+        meta=meta,
+        label="store",
+        path=path,
+        dims=dims,
+        columns=columns,
+    )
@@ -1,6 +1,14 @@
 """Tools to retrieve and push data."""
 
+from .download import download, retry
 from .openkapsarc import OpenKAPSARC
-from .sdmx import get_sdmx
+from .sdmx import get_sdmx, iter_sdmx, write_sdmx
 
-__all__ = ["OpenKAPSARC", "get_sdmx"]
+__all__ = [
+    "OpenKAPSARC",
+    "download",
+    "get_sdmx",
+    "iter_sdmx",
+    "retry",
+    "write_sdmx",
+]
@@ -0,0 +1,216 @@
+"""Robust file downloads."""
+
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+import requests
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+#: HTTP status codes for which a request is retried.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    """Temporary error; the operation may succeed if tried again."""
+
+    pass
+
+
+def retry(
+    func: Callable[[], T],
+    retries: int = 3,
+    backoff: float = 1.0,
+    exceptions=(
+        RetryableError,
+        requests.ConnectionError,
+        requests.HTTPError,
+        requests.Timeout,
+    ),
+) -> T:
+    """Call `func`, retrying up to `retries` times on any of `exceptions`.
+
+    Before the *n*-th retry, wait for `backoff` × 2 :sup:`n - 1` seconds.
+    :class:`requests.HTTPError` is only retried for responses with
+    :data:`RETRY_STATUS`.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except exceptions as e:
+            response = getattr(e, "response", None)
+            if attempt == retries or (
+                isinstance(e, requests.HTTPError)
+                and getattr(response, "status_code", None) not in RETRY_STATUS
+            ):
+                raise
+            delay = backoff * 2**attempt
+            log.info(f"{e!r}; retry in {delay:.1f} s")
+            time.sleep(delay)
+
+    raise AssertionError  # pragma: no cover
+
+
+def download(
+    url: str,
+    path: Path,
+    session: Optional[requests.Session] = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 60,
+    **kwargs,
+) -> Path:
+    """Download `url` to `path`.
+
+    Data is written to a partial file, :file:`{path}.part`, which replaces `path` only
+    once the download is complete. If the partial file exists—for instance, from an
+    earlier, interrupted call—the download resumes from the end of the partial file,
+    using an HTTP range request. Connection errors, time-outs, and responses with
+    :data:`RETRY_STATUS` are retried as for :func:`retry`.
+
+    To resume safely, the ETag or Last-Modified header of the response that started the
+    partial file, and the total length, are recorded in :file:`{path}.part.json`. The
+    range request includes an "If-Range" header with this value, so that the server
+    sends the whole file if it has changed. The partial file is discarded, and the
+    download started over, if:
+
+    - there is no record, or the response had no strong validator to record;
+    - the server sends the whole file instead of the requested range; or
+    - the "Content-Range" of the response does not continue the partial file, or gives
+      a different total length.
+
+    Parameters
+    ----------
+    session : requests.Session, optional
+        Session to use for requests, for instance to reuse connections.
+    kwargs
+        Passed to :meth:`requests.Session.get`, for instance `params`.
+
+    Returns
+    -------
+    pathlib.Path
+        `path`.
+    """
+    path = Path(path)
+    part = path.with_name(f"{path.name}.part")
+    session = session or requests.Session()
+
+    def _attempt():
+        while not _get_part(session, url, part, timeout=timeout, **kwargs):
+            # Discard the partial file and start over
+            part.unlink(missing_ok=True)
+            _info_path(part).unlink(missing_ok=True)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    retry(
+        _attempt,
+        retries,
+        backoff,
+        exceptions=(
+            RetryableError,
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ),
+    )
+    os.replace(part, path)
+    _info_path(part).unlink(missing_ok=True)
+
+    return path
+
+
+def _info_path(part: Path) -> Path:
+    """Return the path of the information for resuming the download to `part`."""
+    return part.with_name(f"{part.name}.json")
+
+
+def _get_part(session: requests.Session, url: str, part: Path, **kwargs) -> bool:
+    """Download all or the remainder of `url` to `part`.
+
+    Helper for :func:`download`. Returns :obj:`False` if `part` must be discarded and
+    the download started over.
+    """
+    info_path = _info_path(part)
+    try:
+        info = json.loads(info_path.read_text())
+    except (FileNotFoundError, ValueError):
+        info = {}
+    offset = part.stat().st_size if part.exists() else 0
+    headers = dict(kwargs.pop("headers", {}))
+    if offset:
+        if not info.get("validator"):
+            log.info(f"Cannot resume {url} without ETag or Last-Modified")
+            return False
+        headers.update({"Range": f"bytes={offset}-", "If-Range": info["validator"]})
+
+    with session.get(url, headers=headers, stream=True, **kwargs) as r:
+        if r.status_code in RETRY_STATUS:
+            raise RetryableError(f"HTTP {r.status_code} for {url}")
+        elif r.status_code == 416 and offset:
+            # Range not satisfiable: the partial file may already be complete
+            return _content_range(r)[1] == offset
+        r.raise_for_status()
+
+        if r.status_code == 206:
+            start, length = _content_range(r)
+            if start != offset or length != info.get("length", length):
+                log.info(f"Range {start}/{length} of {url} does not match")
+                return False
+            log.info(f"Resume {url} from byte {offset}")
+            mode = "ab"
+        else:
+            # Server sent the whole file, for instance because it changed
+            if offset:
+                log.info(f"Restart {url}")
+            mode = "wb"
+            info_path.write_text(json.dumps(_resume_info(r)))
+
+        with open(part, mode) as f:
+            for chunk in r.iter_content(chunk_size=2**16):
+                f.write(chunk)
+
+    return True
+
+
+def _content_range(response: requests.Response) -> Tuple[Optional[int], Optional[int]]:
+    """Return the first byte and total length from the Content-Range of `response`.
+
+    Either is :obj:`None` if not given.
+    """
+    match = re.fullmatch(
+        r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)", response.headers.get("Content-Range", "")
+    )
+    if match is None:
+        return None, None
+    start, length = match.groups()
+    return (
+        None if start is None else int(start),
+        None if length == "*" else int(length),
+    )
+
+
+def _resume_info(response: requests.Response) -> Dict[str, Any]:
+    """Return information from `response` needed to resume the download later.
+
+    This is a strong validator for an "If-Range" header, and the total length.
+    """
+    headers = response.headers
+    if headers.get("Content-Encoding", "identity") != "identity":
+        # Byte ranges refer to the encoded data, not the decoded data that is written
+        return {}
+
+    # Weak ETags cannot be used with If-Range
+    etag = headers.get("ETag", "")
+    validator = etag if etag and not etag.startswith("W/") else None
+    length = headers.get("Content-Length")
+    return dict(
+        validator=validator or headers.get("Last-Modified"),
+        length=None if length is None else int(length),
+    )
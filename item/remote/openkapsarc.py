@@ -1,12 +1,20 @@
+import hashlib
 import json
 import logging
 import sys
 from datetime import datetime
+from pathlib import Path
+from typing import Dict
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 from item.common import config, paths
+from item.util import atomic_path, write_atomic
+
+from .download import RETRY_STATUS
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -50,11 +58,20 @@ class OpenKAPSARC:
 
     See https://datasource.kapsarc.org/api/v2/console
 
+    All requests use a single :class:`requests.Session`, so connections to the server
+    are kept alive and reused.
+
     Parameters
     ----------
     server : str, optional
         Address of the server, e.g. `http://example.com:8888`.
-
+    timeout : float, optional
+        Timeout for each request, in seconds.
+    retries : int, optional
+        Number of times to retry requests after connection errors or responses with
+        :data:`.download.RETRY_STATUS`.
+    backoff : float, optional
+        Initial delay between retries, in seconds; doubled for each later retry.
     """
 
     ALL = sys.maxsize
@@ -65,9 +82,22 @@ class OpenKAPSARC:
     # sets hosted by the software provider used by KAPSARC
     source = "catalog"
 
-    def __init__(self, server=None, api_key=None):
+    def __init__(self, server=None, api_key=None, timeout=60, retries=3, backoff=1.0):
         self.server = server or self.server
         self.api_key = api_key or config.get("api_key", None)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=sorted(RETRY_STATUS),
+                allowed_methods=["GET"],
+            )
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def _modify_params(self, params):
         params.setdefault("apikey", self.api_key)
@@ -75,25 +105,27 @@ class OpenKAPSARC:
     def endpoint(self, name, *args, params={}, **kwargs):
         """Call the API endpoint *name* with any additional *args*."""
         # Construct the URL
+        params = params.copy()
         self._modify_params(params)
         args = list(filter(None, args))
         url_parts = [self.server, self.source, name] + args
 
         # Make the request
-        r = requests.get("/".join(url_parts), params=params, **kwargs)
+        kwargs.setdefault("timeout", self.timeout)
+        r = self.session.get("/".join(url_parts), params=params, **kwargs)
         log.debug(r.url)
 
         r.raise_for_status()
 
-        if "application/json" in r.headers["content-type"]:
+        if "application/json" in r.headers.get("content-type", ""):
             # Response in JSON
             try:
                 return r.json()
-            except json.JSONDecodeErrors:
+            except json.JSONDecodeError:
                 log.error(r.content)
                 raise
         else:
-            log.debug(r.headers["content-type"])
+            log.debug(r.headers.get("content-type"))
             return r
 
     def datasets(self, dataset_id=None, *args, params={}, kw=None, **kwargs):
@@ -119,6 +151,16 @@ class OpenKAPSARC:
 
         Currently only the latest data on the master branch is returned.
 
+        If *cache* is :obj:`True`, data retrieved earlier is returned if it is current.
+        This is checked using a manifest stored next to the cached file (see
+        :func:`read_manifest`), without reading the data itself:
+
+        1. If the records count and processing time reported by the server match the
+           manifest, the cached data is used without any further request.
+        2. Otherwise, the export is requested conditionally, using the ``ETag`` and
+           ``Last-Modified`` headers of the earlier response. If the server responds
+           “304 Not Modified”, the cached data is used.
+
         Returns
         -------
         :class:`pandas.DataFrame`
@@ -129,44 +171,117 @@ class OpenKAPSARC:
 
         # Cache path
         cache_path = (paths["historical"] / ds.uid).with_suffix(".csv")
-        cache_is_valid = False
         log.info(f"Cache path {cache_path}")
 
-        if cache and cache_path.exists():
-            cache_is_valid = True
-
-            # Check cache time
-            cache_time = datetime.fromtimestamp(cache_path.stat().st_mtime)
-            if cache_time < ds.data_processed.replace(tzinfo=None):
-                cache_is_valid = False
-                log.info("…is outdated → remove")
-
-            if cache_is_valid:
-                # Check cache length
-                with open(cache_path) as f:
-                    cache_records = sum(1 for _ in f)
-
-                if cache_records < ds.records_count:
-                    cache_is_valid = False
-                    log.info(
-                        f"...has fewer records ({cache_records}) than "
-                        f"source ({ds.records_count}) -> remove"
-                    )
-
-            if not cache_is_valid:
-                cache_path.unlink()
-            else:
-                log.info("…is current; reading from file")
-                return pd.read_csv(cache_path, sep=";")
+        manifest = read_manifest(cache_path) if cache else {}
+        if manifest.get("records_count") == ds.records_count and manifest.get(
+            "data_processed"
+        ) == str(ds.data_processed):
+            log.info("…is current; reading from file")
+            return _read_cached(cache_path)
+
+        headers = kwargs.pop("headers", {}).copy()
+        if manifest.get("etag"):
+            headers["If-None-Match"] = manifest["etag"]
+        if manifest.get("last_modified"):
+            headers["If-Modified-Since"] = manifest["last_modified"]
 
         # Stream data
         kwargs["stream"] = True
         args = ["datasets", dataset_id, "exports", "csv"]
-        with self.endpoint(*args, **kwargs) as response:
-            # Write content to file
-            with open(cache_path, "wb") as cache:
-                for chunk in response.iter_content():
-                    cache.write(chunk)
-
-        # Parse and return
-        return pd.read_csv(cache_path, sep=";")
+        with self.endpoint(*args, headers=headers, **kwargs) as response:
+            if response.status_code == 304:
+                log.info("…is not modified; reading from file")
+                manifest.update(
+                    data_processed=str(ds.data_processed),
+                    records_count=ds.records_count,
+                )
+                _write_json(_manifest_path(cache_path), manifest)
+                return _read_cached(cache_path)
+
+            # Write content to a temporary file, then replace any existing file
+            h = hashlib.blake2b(digest_size=20)
+            with atomic_path(cache_path) as tmp, open(tmp, "wb") as cache_file:
+                for chunk in response.iter_content(chunk_size=2**16):
+                    cache_file.write(chunk)
+                    h.update(chunk)
+
+            manifest = dict(
+                data_processed=str(ds.data_processed),
+                records_count=ds.records_count,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                blake2b=h.hexdigest(),
+                size=cache_path.stat().st_size,
+            )
+
+        # Parse, store a copy for fast reading, and return
+        df = pd.read_csv(cache_path, sep=";")
+        _write_parsed(cache_path, df, manifest)
+        _write_json(_manifest_path(cache_path), manifest)
+
+        return df
+
+
+def _manifest_path(cache_path: Path) -> Path:
+    """Path of the manifest for `cache_path`."""
+    return cache_path.with_suffix(".json")
+
+
+def _write_json(path: Path, data: Dict) -> None:
+    """Write `data` to `path` as JSON, via a temporary file."""
+    write_atomic(path, json.dumps(data, indent=2))
+
+
+def read_manifest(cache_path: Path) -> Dict:
+    """Return the manifest for `cache_path`, if it is valid.
+
+    The manifest is stored in a JSON file next to `cache_path`. It contains:
+
+    - ``records_count``, ``data_processed``: dataset information from the server.
+    - ``etag``, ``last_modified``: HTTP cache validators from the export response.
+    - ``blake2b``, ``size``: hash and size in bytes of the file as downloaded.
+    - ``parsed`` (optional): name of a Parquet file with the parsed data.
+
+    The manifest is only valid if the size of `cache_path` matches; the file itself is
+    not read. If there is no valid manifest, an empty :class:`dict` is returned.
+    """
+    try:
+        manifest = json.loads(_manifest_path(cache_path).read_text())
+        valid = manifest["size"] == cache_path.stat().st_size
+    except (KeyError, OSError, TypeError, ValueError):
+        valid = False
+
+    return manifest if valid else {}
+
+
+def _write_parsed(cache_path: Path, df: pd.DataFrame, manifest: Dict) -> None:
+    """Store `df`, the parsed contents of `cache_path`, as Parquet, if possible."""
+    parsed_path = cache_path.with_suffix(".parquet")
+    try:
+        with atomic_path(parsed_path) as tmp:
+            df.to_parquet(tmp, index=False)
+    except ImportError:
+        return  # pyarrow not installed
+    except (TypeError, ValueError) as e:
+        # e.g. columns with mixed types that cannot be stored as Parquet
+        log.info(f"Cannot store parsed data: {e!r}")
+        return
+
+    manifest["parsed"] = parsed_path.name
+
+
+def _read_cached(cache_path: Path) -> pd.DataFrame:
+    """Read cached data from `cache_path`.
+
+    If available, the Parquet file written by :func:`_write_parsed` is read instead of
+    parsing the CSV file again.
+    """
+    manifest = read_manifest(cache_path)
+    if parsed := manifest.get("parsed"):
+        try:
+            return pd.read_parquet(cache_path.with_name(parsed))
+        except (ImportError, OSError):
+            pass
+
+    return pd.read_csv(cache_path, sep=";")
@@ -1,8 +1,41 @@
-from typing import Optional
+import logging
+from itertools import product
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
 
 import pandas as pd
 import sdmx
 
+from item.util import atomic_path
+
+if TYPE_CHECKING:
+    import sdmx.message
+
+log = logging.getLogger(__name__)
+
+
+def _to_frame(msg) -> pd.DataFrame:
+    """Convert a data message `msg` to a :class:`pandas.DataFrame`.
+
+    Attributes are preserved, and all columns from the index (dimensions) are
+    categorical.
+    """
+    # Convert to pd.DataFrame, preserving attributes
+    df = sdmx.to_pandas(msg, attributes="dgso")
+    index_cols = df.index.names
+
+    # Reset index, use categoricals
+    return df.reset_index().astype({c: "category" for c in index_cols})
+
 
 def get_sdmx(source: Optional[str] = None, **args) -> pd.DataFrame:
     """Retrieve data from *source* using :mod:`sdmx`.
@@ -17,6 +50,10 @@ def get_sdmx(source: Optional[str] = None, **args) -> pd.DataFrame:
     Returns
     -------
     pandas.DataFrame
+
+    See also
+    --------
+    iter_sdmx
     """
     # SDMX client for the data source
     req = sdmx.Client(source=source)
@@ -27,9 +64,195 @@ def get_sdmx(source: Optional[str] = None, **args) -> pd.DataFrame:
     # Retrieve the data
     msg = req.get(resource_type="data", **args)
 
-    # Convert to pd.DataFrame, preserving attributes
-    df = sdmx.to_pandas(msg, attributes="dgso")
-    index_cols = df.index.names
+    return _to_frame(msg)
 
-    # Reset index, use categoricals
-    return df.reset_index().astype({c: "category" for c in index_cols})
+
+def _codes(client: sdmx.Client, resource_id: str, dim_id: str) -> List[str]:
+    """Return the IDs of codes for dimension `dim_id` of dataflow `resource_id`."""
+    sm = cast(
+        "sdmx.message.StructureMessage",
+        client.get(
+            resource_type="dataflow",
+            resource_id=resource_id,
+            params=dict(references="all"),
+        ),
+    )
+    dsd = sm.dataflow[resource_id].structure
+    # The DSD may be given separately from the dataflow in the message
+    dsd = sm.structure.get(dsd.id, dsd)
+    return [c.id for c in dsd.dimensions.get(dim_id).local_representation.enumerated]
+
+
+def iter_sdmx(
+    source: Optional[str] = None,
+    split_by: Optional[str] = None,
+    periods: Optional[Sequence[Tuple[int, int]]] = None,
+    **args,
+) -> Iterator[pd.DataFrame]:
+    """Retrieve data from *source* in chunks, using :mod:`sdmx`.
+
+    Instead of a single request for all the data (like :func:`get_sdmx`), one request
+    is made for each chunk, so that only one data message is held in memory at a time.
+    Requests that return no data are skipped.
+
+    Arguments
+    ---------
+    source : str
+        Name of a data source recognized by ``sdmx1``, e.g. 'OECD'.
+    split_by : str, optional
+        ID of a dimension, e.g. 'COUNTRY'. One request is made for each code in the
+        code list that represents this dimension in the data structure.
+    periods : list of (int, int), optional
+        Ranges of time periods, e.g. ``[(1970, 1999), (2000, 2030)]``. One request is
+        made for each range, using the ``startPeriod`` and ``endPeriod`` query
+        parameters.
+    args
+        Other arguments to :meth:`sdmx.Client.get`. If `split_by` is given, the
+        ``key`` argument, if any, must be a :class:`dict`.
+
+    Yields
+    ------
+    pandas.DataFrame
+        with the same form as returned by :func:`get_sdmx`.
+
+    See also
+    --------
+    write_sdmx
+    """
+    # SDMX client for the data source
+    req = sdmx.Client(source=source)
+
+    base_key = args.pop("key", None)
+    base_params = args.pop("params", {})
+
+    if split_by is None:
+        keys: Iterable = [base_key]
+    elif base_key is not None and not isinstance(base_key, dict):
+        raise ValueError(f"split_by={split_by!r} with key={base_key!r}; need a dict")
+    else:
+        codes = _codes(req, args["resource_id"], split_by)
+        keys = [dict(base_key or {}, **{split_by: code}) for code in codes]
+
+    params_list: Iterable = [base_params]
+    if periods:
+        params_list = [
+            dict(base_params, startPeriod=str(start), endPeriod=str(end))
+            for start, end in periods
+        ]
+
+    for key, params in product(keys, params_list):
+        log.info(f"Retrieve {key=} {params=}")
+        try:
+            msg = cast(
+                "sdmx.message.DataMessage",
+                req.get(resource_type="data", key=key, params=params, **args),
+            )
+        except Exception as e:
+            # Most SDMX web services respond 404 if there is no data for a query
+            if getattr(getattr(e, "response", None), "status_code", None) == 404:
+                log.info("No data")
+                continue
+            raise
+
+        if not any(len(ds) for ds in msg.data):
+            continue
+
+        yield _to_frame(msg)
+
+
+def write_sdmx(path: Path, chunks: Iterable[pd.DataFrame]) -> int:
+    """Write `chunks` of data, e.g. from :func:`iter_sdmx`, to `path`.
+
+    Each chunk is appended to the file and then discarded. The format is determined by
+    the suffix of `path`: either :file:`.csv`, or :file:`.parquet` (requires
+    :mod:`pyarrow`). The data is first written to a temporary file, which replaces
+    `path` only once all chunks are written.
+
+    The columns of the first chunk determine the columns of the file. Columns missing
+    from later chunks are empty; additional columns in later chunks are discarded.
+
+    Returns
+    -------
+    int
+        Total number of rows written.
+    """
+    path = Path(path)
+    if path.suffix not in (".csv", ".parquet"):
+        raise ValueError(f"Cannot write {path.suffix!r}; expected '.csv' or '.parquet'")
+
+    columns: List[str] = []
+    writer = None
+    rows = 0
+
+    with atomic_path(path) as tmp:
+        try:
+            for df in chunks:
+                if not columns:
+                    columns = list(df.columns)
+                elif extra := set(df.columns) - set(columns):
+                    log.warning(
+                        f"Discard column(s) not in first chunk: {sorted(extra)}"
+                    )
+                df = df.reindex(columns=columns)
+
+                if path.suffix == ".csv":
+                    df.to_csv(tmp, mode="a", header=rows == 0, index=False)
+                else:
+                    writer = _write_parquet(tmp, df, writer)
+
+                rows += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if writer is None and rows == 0:
+            # No data; write an empty file
+            empty = pd.DataFrame(columns=columns)
+            if path.suffix == ".csv":
+                empty.to_csv(tmp, index=False)
+            else:
+                empty.to_parquet(tmp, index=False)
+
+    log.info(f"Wrote {rows} rows to {path}")
+
+    return rows
+
+
+def _write_parquet(path: Path, df: pd.DataFrame, writer=None):
+    """Append `df` to a Parquet file at `path` using `writer`.
+
+    If `writer` is :obj:`None`, a new :class:`pyarrow.parquet.ParquetWriter` is
+    created and returned. Non-numeric columns are stored as dictionary-encoded strings,
+    so the schema is the same for every chunk regardless of its categories.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if writer is None:
+        schema = pa.schema(
+            [
+                (
+                    name,
+                    pa.float64()
+                    if pd.api.types.is_numeric_dtype(dtype)
+                    else pa.dictionary(pa.int32(), pa.string()),
+                )
+                for name, dtype in df.dtypes.items()
+            ]
+        )
+        writer = pq.ParquetWriter(path, schema)
+
+    df = df.astype(
+        {
+            f.name: "float64" if pa.types.is_floating(f.type) else "category"
+            for f in writer.schema
+        }
+    )
+    # Categories must be strings to match the schema
+    for name in df.select_dtypes("category").columns:
+        df[name] = df[name].cat.rename_categories(str)
+
+    writer.write_table(
+        pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False)
+    )
+    return writer
@@ -1,12 +1,17 @@
 import logging
+import pickle
 from collections import ChainMap
 from datetime import datetime
 from functools import lru_cache
-from typing import TYPE_CHECKING, List, cast
+from importlib.metadata import version
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, cast
 
 import numpy as np
+import pandas as pd
+import sdmx
 import sdmx.message as msg
 import sdmx.urn
+from platformdirs import user_cache_path
 from sdmx import Client
 from sdmx.model import common as m
 from sdmx.model import v21
@@ -22,6 +27,7 @@ from sdmx.model.v21 import (
 )
 
 from item.structure import base
+from item.util import file_hash, write_atomic
 
 if TYPE_CHECKING:
     import sdmx.model.common
@@ -29,6 +35,9 @@ if TYPE_CHECKING:
 
 log = logging.getLogger(__name__)
 
+#: Directory for cached data structures. See :func:`generate` and :func:`get_cdc`.
+CACHE_PATH = user_cache_path("item").joinpath("structure")
+
 
 def _get_anno(obj, id):
     """Wrapper around :meth:`AnnotableArtefact.get_annotation`.
@@ -54,15 +63,68 @@ def _pop_anno(obj, id):
 
 @lru_cache()
 def get_cdc():
-    """Retrieve the ``CROSS_DOMAIN_CONCEPTS`` from the SDMX Global Registry."""
+    """Retrieve the ``CROSS_DOMAIN_CONCEPTS`` from the SDMX Global Registry.
+
+    The concept scheme is stored as SDMX-ML in :data:`CACHE_PATH`, and read from there
+    by later calls. A network connection is only needed the first time. To retrieve the
+    latest version from the registry, delete the cached file.
+    """
     id = "CROSS_DOMAIN_CONCEPTS"
-    msg = Client("SGR").conceptscheme(id)
-    return msg.concept_scheme[id]
+    path = CACHE_PATH.joinpath(f"{id}.xml")
+
+    if path.exists():
+        return sdmx.read_sdmx(path).concept_scheme[id]
+
+    cs = Client("SGR").conceptscheme(id).concept_scheme[id]
+    write_atomic(path, sdmx.to_xml(msg.StructureMessage(concept_scheme={id: cs})))
+    log.info(f"Cached {path}")
+
+    return cs
 
 
 @lru_cache()
 def generate() -> msg.StructureMessage:
-    """Return the SDMX data structures for iTEM data."""
+    """Return the SDMX data structures for iTEM data.
+
+    The structures are stored in :data:`CACHE_PATH`, and loaded from there by later
+    calls, including in other processes. They are regenerated if any of the following
+    change: :data:`.base.VERSION`; the source code of :mod:`.structure.base` or this
+    module; or the version of :mod:`sdmx`.
+
+    .. note:: The cache uses :mod:`pickle`, not SDMX-ML (like :file:`structure.xml`).
+       SDMX-ML 2.1 cannot represent the excluded values in some of the member
+       selections in :data:`.base.CONSTRAINTS`, e.g. “MODE not in {ROAD}”.
+    """
+    # Key for the cached structures
+    key = "-".join(
+        [base.VERSION, version("sdmx1")]
+        + [file_hash(p)[:8] for p in (base.__file__, __file__)]
+    )
+    path = CACHE_PATH.joinpath(f"structure-{key}.pkl")
+
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    sm = _generate()
+
+    # Remove structures generated with other code or versions
+    for other in CACHE_PATH.glob("structure-*.pkl"):
+        other.unlink(missing_ok=True)
+    write_atomic(path, pickle.dumps(sm))
+    log.info(f"Cached {path}")
+
+    return sm
+
+
+@lru_cache()
+def _generate() -> msg.StructureMessage:
+    """Generate the SDMX data structures for iTEM data; see :func:`generate`.
+
+    This modifies objects in :mod:`.structure.base`, so is only run once per process.
+    """
     item_agency = base.AS_ITEM["iTEM"]
 
     sm = msg.StructureMessage(
@@ -175,17 +237,10 @@ def make_iamc_variable_cl(
     dsd.urn = sdmx.urn.make(dsd)
 
     # Retrieve a constraint that affects this DSD
-    # FIXME this duplicates code in merge_dsd(); deduplicate
-    cc = None
-    if use_constraint:
-        ccs = [cc for cc in sm.constraint.values() if dsd in cc.content]
-        assert len(ccs) <= 1
-        cc = ccs[0] if len(ccs) and len(ccs[0].data_content_region) else None
+    cc = get_constraint(sm, dsd) if use_constraint else None
 
     # Dimensions other than REF_AREA (→ IAMC 'REGION'), TIME_PERIOD (→ IAMC 'YEAR')
-    dims = list(
-        filter(lambda d: d.id not in ("REF_AREA", "TIME_PERIOD"), dsd.dimensions)
-    )
+    dims = [d.id for d in dsd.dimensions if d.id not in ("REF_AREA", "TIME_PERIOD")]
 
     # Identify the measure quantity based on the structure ID
     # FIXME Set this association within the DSD itself, and retrieve from there
@@ -202,12 +257,13 @@ def make_iamc_variable_cl(
     var = f"{c_measure.name.localizations[locale]}"
 
     # Iterate over keys
-    for key in dsd.iter_keys(constraint=cc):
+    # NB DataFrame.itertuples() yields nothing if `dims` is empty, e.g. for GDP
+    for values in key_frame(dsd, cc)[dims].to_numpy().tolist():
         # Parts for Code.id
-        id_parts = [var] + [key[d].value.id for d in dims]
+        id_parts = [var] + values
 
         # Parts to save in an annotation
-        key_parts = dict((d, kv.value.id) for d, kv in key.values.items() if d in dims)
+        key_parts = dict(zip(dims, values))
 
         # Create the Code.id
         new_id = format_id("|".join(id_parts))
@@ -226,51 +282,361 @@ def make_iamc_variable_cl(
     return cl_new
 
 
-def merge_dsd(
+def get_constraint(
+    sm: msg.StructureMessage, dsd: "sdmx.model.common.BaseDataStructureDefinition"
+) -> Optional["sdmx.model.v21.ContentConstraint"]:
+    """Return the ContentConstraint in `sm` that applies to `dsd`, if any.
+
+    :obj:`None` is returned if there is no such constraint, or it has no CubeRegions.
+    """
+    ccs = [cc for cc in sm.constraint.values() if dsd in cc.content]
+    assert len(ccs) <= 1
+    return ccs[0] if len(ccs) and len(ccs[0].data_content_region) else None
+
+
+def key_frame(
+    dsd: "sdmx.model.common.BaseDataStructureDefinition",
+    constraint: Optional["sdmx.model.v21.ContentConstraint"] = None,
+) -> pd.DataFrame:
+    """Return all keys of `dsd` that are within `constraint`, one per row.
+
+    The result contains the same keys, in the same order, as :meth:`.iter_keys`, but
+    is computed without creating any :class:`.Key` objects. Keys are enumerated as
+    integer indices into the code list for each dimension, one dimension at a time.
+    Each :class:`.CubeRegion` and :class:`.DataKeySet` in `constraint` is evaluated as
+    a boolean mask over these indices as soon as all the dimensions it refers to have
+    been added, so excluded keys are dropped before the next dimension multiplies their
+    number.
+
+    Use :func:`iter_frame_keys` to obtain :mod:`sdmx` objects for the keys.
+
+    Returns
+    -------
+    pandas.DataFrame
+        with one column per dimension of `dsd`, containing code IDs. Dimensions not
+        enumerated by a code list have the single value "(DIM_ID)", as with
+        :meth:`.iter_keys`.
+    """
+    dim_ids = [dim.id for dim in dsd.dimensions]
+    codes = _dim_codes(dsd)
+    masks = _constraint_masks(constraint, dim_ids, codes)
+
+    # Indices of valid keys along the dimensions enumerated so far
+    idx = np.zeros((1, 0), dtype=np.intp)
+    for i, dim_codes in enumerate(codes):
+        # Cartesian product with the codes for the next dimension
+        n = len(dim_codes)
+        idx = np.column_stack(
+            [np.repeat(idx, n, axis=0), np.tile(np.arange(n), len(idx))]
+        )
+
+        # Apply any constraints involving this and earlier dimensions only
+        for evaluate, last in masks:
+            if last == i:
+                idx = idx[evaluate(idx)]
+
+    return pd.DataFrame({d: codes[i][idx[:, i]] for i, d in enumerate(dim_ids)})
+
+
+def _dim_codes(
+    dsd: "sdmx.model.common.BaseDataStructureDefinition",
+) -> List[np.ndarray]:
+    """Return arrays of the code IDs for each dimension of `dsd`.
+
+    Helper for :func:`key_frame` and :class:`KeyValidator`. Dimensions not enumerated
+    by a code list have the single value "(DIM_ID)".
+    """
+    codes = []
+    for dim in dsd.dimensions:
+        try:
+            ids = [item.id for item in dim.local_representation.enumerated]  # type: ignore [union-attr]
+        except (AttributeError, TypeError):
+            ids = [f"({dim.id})"]
+        codes.append(np.array(ids, dtype=object))
+    return codes
+
+
+def _code_labels(cl: "sdmx.model.common.Codelist") -> Dict[str, int]:
+    """Return a mapping from case-folded IDs and names of codes in `cl` to positions.
+
+    Helper for :class:`KeyValidator`. Where the name of one code is the same as the ID
+    of another, the ID takes precedence.
+    """
+    result = {}
+    for i, code in enumerate(cl):
+        name = code.name.localized_default()
+        if name and name.casefold() not in result:
+            result[name.casefold()] = i
+    for i, code in enumerate(cl):
+        result[code.id.casefold()] = i
+    return result
+
+
+def _constraint_masks(
+    constraint: Optional["sdmx.model.v21.ContentConstraint"],
+    dim_ids: List[str],
+    codes: List[np.ndarray],
+) -> list:
+    """Compile `constraint` into functions that evaluate arrays of key indices.
+
+    Helper for :func:`key_frame` and :class:`KeyValidator`. Returns a list with one
+    entry for each CubeRegion and DataKeySet in `constraint`: a function to evaluate
+    it, and the position of the last dimension it involves.
+    """
+    masks: list = []
+    if constraint is not None:
+        for cr in constraint.data_content_region:
+            masks.append(_region_masks(cr, dim_ids, codes))
+        if constraint.data_content_keys is not None:
+            masks.append(_key_set_masks(constraint.data_content_keys, dim_ids, codes))
+    return masks
+
+
+def _region_masks(cr: m.CubeRegion, dim_ids: List[str], codes: List[np.ndarray]):
+    """Return a function to evaluate `cr` for key indices, and its last dimension.
+
+    Helper for :func:`key_frame`.
+    """
+    selected = []
+    for ms in cr.member.values():
+        pos = dim_ids.index(ms.values_for.id)
+        values = [mv.value for mv in ms.values]  # type: ignore [attr-defined]
+        selected.append((pos, np.isin(codes[pos], values) == ms.included))
+
+    def evaluate(idx: np.ndarray) -> np.ndarray:
+        result = np.ones(len(idx), dtype=bool)
+        for pos, mask in selected:
+            result &= mask[idx[:, pos]]
+        return result == cr.included
+
+    return evaluate, max((pos for pos, _ in selected), default=0)
+
+
+def _key_set_masks(dks, dim_ids: List[str], codes: List[np.ndarray]):
+    """Return a function to evaluate `dks` for key indices, and its last dimension.
+
+    Helper for :func:`key_frame`. A key matches a :class:`.DataKey` if it has the same
+    value for every dimension in the DataKey.
+    """
+    data_keys = []
+    for dk in dks.keys:
+        data_keys.append(
+            [
+                (pos := dim_ids.index(dim.id), codes[pos] == str(cv.value))
+                for dim, cv in dk.key_value.items()
+            ]
+        )
+
+    def evaluate(idx: np.ndarray) -> np.ndarray:
+        result = np.zeros(len(idx), dtype=bool)
+        for selected in data_keys:
+            match = np.ones(len(idx), dtype=bool)
+            for pos, mask in selected:
+                match &= mask[idx[:, pos]]
+            result |= match
+        return result == dks.included
+
+    return evaluate, max((pos for dk in data_keys for pos, _ in dk), default=0)
+
+
+class KeyValidator:
+    """Check the keys of observations against the code lists and constraint for `dsd`.
+
+    Creating a KeyValidator compiles `dsd` and `constraint` once:
+
+    - The code list for each dimension becomes a mapping used to convert labels to
+      integer codes. A label matches a code if it is the same as the code's ID or
+      name, ignoring case. For instance, "Road", "road", and "ROAD" all match the code
+      ``ROAD`` in ``CL_MODE``, and "Activity" matches ``ACTIVITY`` in ``CL_VARIABLE``.
+    - Each :class:`.CubeRegion` and :class:`.DataKeySet` in `constraint` becomes a
+      boolean array over these codes, for each dimension it involves.
+
+    :meth:`validate` then checks all the rows of a data frame at once, without
+    creating any :class:`.Key` objects.
+
+    Parameters
+    ----------
+    dsd :
+        Data structure definition. Dimensions not enumerated by a code list, e.g.
+        ``REF_AREA`` and ``TIME_PERIOD``, are not checked.
+    constraint : optional
+        Content constraint applying to `dsd`, e.g. from :func:`get_constraint`.
+
+    See also
+    --------
+    get_validator
+    """
+
+    def __init__(
+        self,
+        dsd: "sdmx.model.common.BaseDataStructureDefinition",
+        constraint: Optional["sdmx.model.v21.ContentConstraint"] = None,
+    ):
+        self.dim_ids = [dim.id for dim in dsd.dimensions]
+        codes = _dim_codes(dsd)
+
+        #: Index of code IDs, for each dimension enumerated by a code list.
+        self.codes = {}
+        #: Mapping from case-folded code IDs and names to positions in :attr:`codes`.
+        self.labels = {}
+        for dim, c in zip(dsd.dimensions, codes):
+            cl = getattr(dim.local_representation, "enumerated", None)
+            if cl is None:
+                continue
+            self.codes[dim.id] = pd.Index(c)
+            self.labels[dim.id] = _code_labels(cl)
+
+        self._masks = [
+            evaluate
+            for evaluate, _ in _constraint_masks(constraint, self.dim_ids, codes)
+        ]
+
+    def invalid(self, df: pd.DataFrame) -> np.ndarray:
+        """Return a boolean array that is :obj:`True` for rows of `df` with invalid keys.
+
+        A key is invalid if any of its values does not match a code in the code list
+        for the respective dimension, or if it is outside the constraint.
+
+        Raises
+        ------
+        KeyError
+            if `df` lacks a column for any dimension enumerated by a code list.
+        """
+        missing = set(self.codes) - set(df.columns)
+        if missing:
+            raise KeyError(f"No column(s) for dimension(s) {sorted(missing)}")
+
+        # Integer codes for each dimension; -1 for labels not in the code list. Only the
+        # distinct labels in each column are looked up.
+        idx = np.zeros((len(df), len(self.dim_ids)), dtype=np.int32)
+        result = np.zeros(len(df), dtype=bool)
+        for i, dim_id in enumerate(self.dim_ids):
+            if dim_id not in self.codes:
+                continue
+            labels, uniques = pd.factorize(df[dim_id])
+            lookup = self.labels[dim_id]
+            # NB labels == -1 for missing values selects the appended -1
+            pos = [lookup.get(str(u).casefold(), -1) for u in uniques] + [-1]
+            idx[:, i] = np.array(pos, dtype=np.int32)[labels]
+            result |= idx[:, i] == -1
+
+        # Evaluate the constraint for the remaining rows
+        valid = np.flatnonzero(~result)
+        idx = idx[valid]
+        ok = np.ones(len(valid), dtype=bool)
+        for evaluate in self._masks:
+            ok &= evaluate(idx)
+        result[valid[~ok]] = True
+
+        return result
+
+    def validate(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Return the rows of `df` with invalid keys; see :meth:`invalid`."""
+        return df[self.invalid(df)]
+
+
+@lru_cache()
+def get_validator(dsd_id: str) -> KeyValidator:
+    """Return a :class:`KeyValidator` for the iTEM data structure `dsd_id`.
+
+    The validator uses the constraint, if any, for this structure from
+    :func:`generate`. It is compiled once per process.
+    """
+    sm = generate()
+    dsd = sm.structure[dsd_id]
+    return KeyValidator(dsd, get_constraint(sm, dsd))
+
+
+def iter_frame_keys(
+    df: pd.DataFrame, dsd: "sdmx.model.common.BaseDataStructureDefinition"
+) -> Iterator[m.Key]:
+    """Iterate over :class:`.Key` objects for the rows of `df`.
+
+    `df` has one column per dimension of `dsd`, for instance the result of
+    :func:`key_frame` or :func:`merge_dsd_frame`. Values for dimensions enumerated by
+    a code list refer to the corresponding :class:`.Code`, if any.
+    """
+    dims = [dsd.dimensions.get(d) for d in df.columns]
+    lookup = []
+    for dim in dims:
+        try:
+            lookup.append(dim.local_representation.enumerated)  # type: ignore [union-attr]
+        except AttributeError:
+            lookup.append(None)
+
+    for values in df.itertuples(index=False, name=None):
+        # Values not in the code list, e.g. VARIABLE from merge_dsd(), are kept as str
+        yield m.Key(
+            [
+                m.KeyValue(
+                    id=dim.id,
+                    value=value if cl is None else cl.items.get(value, value),
+                    value_for=dim,
+                )
+                for dim, cl, value in zip(dims, lookup, values)
+            ]
+        )
+
+
+def merge_dsd_frame(
     sm: msg.StructureMessage,
     target: str,
     others: List[str],
     fill_value: str = "_Z",
-) -> "sdmx.model.v21.DataSet":
-    """‘Merge’ 2 or more data structure definitions."""
-    dsd_target = sm.structure[target]
-
-    # Create a temporary DataSet
-    ds: "sdmx.model.v21.DataSet" = DataSet(structured_by=dsd_target)
+) -> pd.DataFrame:
+    """‘Merge’ 2 or more data structure definitions; return the keys as a data frame.
 
-    # Count of keys
-    count = 0
+    The result has one column per dimension of the `target` structure, plus a column
+    "value" containing :data:`numpy.nan`. Each of `others` contributes the keys from
+    :func:`key_frame`, with its own ID for the "VARIABLE" dimension and `fill_value`
+    for any other dimensions of `target` that it does not have.
+    """
+    dsd_target = sm.structure[target]
+    columns = [dim.id for dim in dsd_target.dimensions]
 
+    dfs = []
     for dsd_id in others:
         # Retrieve the DSD
         dsd = sm.structure[dsd_id]
 
-        # Retrieve a constraint that affects this DSD
-        ccs = [cc for cc in sm.constraint.values() if dsd in cc.content]
-        assert len(ccs) <= 1
-        cc = ccs[0] if len(ccs) and len(ccs[0].data_content_region) else None
+        # Keys for `dsd`, with values for dimensions in the target but not in `dsd`
+        df = key_frame(dsd, get_constraint(sm, dsd))
+        fill = {
+            dim.id: dim.local_representation.enumerated[fill_value].id
+            for dim in dsd_target.dimensions
+            if dim.id != "VARIABLE" and dim.id not in df.columns
+        }
+        dfs.append(df.assign(VARIABLE=dsd_id, **fill)[columns])
 
-        # Key for the VARIABLE dimension
-        base_key = m.Key(VARIABLE=dsd_id, described_by=dsd_target.dimensions)
+        log.info(f"{repr(dsd)}: {len(df)} keys")
 
-        # Add KeyValues for other dimensions included in the target but not in this DSD
-        for dim in dsd_target.dimensions:
-            if dim.id in base_key.values or dim.id in dsd.dimensions:
-                continue
-            base_key[dim.id] = dim.local_representation.enumerated[fill_value]
+    result = pd.concat(dfs, ignore_index=True).assign(value=np.nan)
 
-        # Iterate over the possible keys in `dsd`; add to `k`
-        ds.add_obs(
-            Observation(dimension=(base_key + key).order(), value=np.nan)
-            for key in dsd.iter_keys(constraint=cc)
-        )
+    log.info(f"Total keys: {len(result)}\n{result.head()}")
+
+    return result
 
-        log.info(f"{repr(dsd)}: {len(ds.obs) - count} keys")
-        count = len(ds.obs)
 
-    log.info(
-        f"Total keys: {len(ds.obs)}\n"
-        + "\n".join(map(lambda o: repr(o.dimension), ds.obs[:5]))
+def merge_dsd(
+    sm: msg.StructureMessage,
+    target: str,
+    others: List[str],
+    fill_value: str = "_Z",
+) -> "sdmx.model.v21.DataSet":
+    """‘Merge’ 2 or more data structure definitions.
+
+    Returns a :class:`.DataSet` with one :class:`.Observation` for each key from
+    :func:`merge_dsd_frame`, which see.
+    """
+    dsd_target = sm.structure[target]
+
+    # Create a temporary DataSet
+    ds: "sdmx.model.v21.DataSet" = DataSet(structured_by=dsd_target)
+
+    df = merge_dsd_frame(sm, target, others, fill_value)
+    ds.add_obs(
+        Observation(dimension=key, value=np.nan)
+        for key in iter_frame_keys(df.drop(columns="value"), dsd_target)
     )
 
     return ds
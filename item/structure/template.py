@@ -1,7 +1,8 @@
 import logging
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import TYPE_CHECKING, Dict, List, Mapping, Optional
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Sequence
 
 import numpy as np
 import pandas as pd
@@ -9,13 +10,16 @@ import sdmx
 import sdmx.model.common as m
 
 from item.common import paths
-from item.structure.sdmx import _get_anno, generate, merge_dsd
+from item.structure.sdmx import _get_anno, generate, merge_dsd_frame
 
 if TYPE_CHECKING:
     import sdmx.model.common
 
 log = logging.getLogger(__name__)
 
+#: File formats supported by :func:`make_template`.
+FORMATS = ("csv", "parquet", "xlsx")
+
 
 def add_unit(key: Dict, concept: m.Concept) -> None:
     """Add units to a key."""
@@ -76,6 +80,70 @@ def collapse(row: pd.Series) -> pd.Series:
     return pd.Series(data)
 
 
+def _per_category(s: pd.Series, func) -> np.ndarray:
+    """Apply `func` once to each distinct value of `s`; return results for all rows."""
+    c = s.astype("category")
+    result = np.empty(len(c.cat.categories), dtype=object)
+    result[:] = [func(value) for value in c.cat.categories]
+    return result[c.cat.codes.to_numpy()]
+
+
+def collapse_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Collapse multiple concepts into fewer columns, for all rows of `df` at once.
+
+    This gives the same result as ``df.apply(collapse, axis=1)``, but formats the label
+    parts once for each distinct value in each column, instead of once per row.
+
+    See also
+    --------
+    collapse
+    """
+    # Combine 3 concepts with the measure name ("VARIABLE")
+    variable = (
+        _per_category(df["POLLUTANT"], lambda v: f"{v} ")
+        + _per_category(df["VARIABLE"], str)
+        + _per_category(df["LCA_SCOPE"], lambda v: f" ({v})" if len(v) else "")
+        + _per_category(
+            df["FLEET"],
+            lambda v: f" ({v.lower()} vehicles)" if v not in ("Total", "") else "",
+        )
+    )
+
+    # Combine 4 concepts with "MODE"
+    mode = _per_category(df["MODE"], str)
+    operator = _per_category(df["OPERATOR"], lambda v: v.lower() if len(v) else None)
+    automation = _per_category(
+        df["AUTOMATION"], lambda v: ("" if v == "Human" else " AV") if len(v) else None
+    )
+    use_oa = pd.notna(operator) & pd.notna(automation) & (mode == "Light-duty vehicle")
+    oa = np.full(len(df), "", dtype=object)
+    oa[use_oa] = " (" + operator[use_oa] + automation[use_oa] + ")"
+
+    mode = (
+        _per_category(df["SERVICE"], lambda v: f"{v} " if v != "Total" else "")
+        + mode
+        + _per_category(df["VEHICLE"], lambda v: f" {v}" if v != "Total" else "")
+        + oa
+    )
+
+    result = df.drop(
+        columns=[
+            "FLEET",
+            "LCA_SCOPE",
+            "POLLUTANT",
+            "SERVICE",
+            "VEHICLE",
+            "OPERATOR",
+            "AUTOMATION",
+        ]
+    ).assign(
+        VARIABLE=pd.Series(variable, index=df.index).str.strip(),
+        MODE=pd.Series(mode, index=df.index).str.strip(),
+    )
+
+    return result.infer_objects()
+
+
 def name_for_id(
     dsd: "sdmx.model.common.BaseDataStructureDefinition", ids: List[str]
 ) -> Mapping[str, Dict[str, str]]:
@@ -104,14 +172,21 @@ def name_for_id(
     return result
 
 
-def make_template(output_path: Optional[Path] = None, verbose: bool = True):
+def make_template(
+    output_path: Optional[Path] = None,
+    verbose: bool = True,
+    formats: Sequence[str] = ("csv", "xlsx"),
+    workers: int = 3,
+):
     """Generate a data template.
 
     Outputs files containing all keys specified for the iTEM ``HISTORICAL`` data
-    structure definition. The file is produced in two formats:
+    structure definition. The file is produced in any of the :data:`FORMATS`:
 
     - :file:`*.csv`: comma-separated values
-    - :file:`*.xlsx`: Microsoft Excel.
+    - :file:`*.parquet`: Apache Parquet; requires :mod:`pyarrow`.
+    - :file:`*.xlsx`: Microsoft Excel, written row by row using the write-only mode of
+      :mod:`openpyxl`.
 
     …and in three variants:
 
@@ -121,46 +196,39 @@ def make_template(output_path: Optional[Path] = None, verbose: bool = True):
       form.
     - :file:`index.*`: an index or map between the two above versions.
 
+    Parameters
+    ----------
+    formats : sequence of str, optional
+        File formats to write.
+    workers : int, optional
+        With *workers* > 1, the variants are written concurrently in a pool of that
+        many worker processes.
+
+    Raises
+    ------
+    ValueError
+        if any of `formats` is not one of :data:`FORMATS`.
+
     See also
     --------
-    .collapse
+    .collapse_columns
     """
-    # TODO Use SDMX constraints to filter on concepts that are parents of other concepts
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"unknown template format(s) {sorted(unknown)}; use {FORMATS}")
 
     sm = generate()
-
-    ds = merge_dsd(
-        sm,
-        "HISTORICAL",
-        [
-            "GDP",
-            "POPULATION",
-            "PRICE_FUEL",
-            "PRICE_POLLUTANT",
-            "ACTIVITY_VEHICLE",
-            "ACTIVITY",
-            "ENERGY",
-            "EMISSIONS",
-            "ENERGY_INTENSITY",
-            "SALES",
-            "STOCK",
-            "LOAD_FACTOR",
-        ],
-    )
-
-    # Convert to pd.DataFrame
-    df0 = sdmx.to_pandas(ds).reset_index()
+    df0 = template_keys(sm)
 
     # Save in multiple formats
     output_path = output_path or paths["output"]
-    log.info(f"Output to {output_path}/{{index,template}}.{{csv,xlsx}}")
+    log.info(
+        f"Output to {output_path}/{{full,condensed,index}}.{{{','.join(formats)}}}"
+    )
 
     # "Index" format: only simple replacements, full dimensionality
     df1 = df0.replace({"_Z": "", np.nan: "", "(REF_AREA)": "…", "(TIME_PERIOD)": "…"})
 
-    df1.to_csv(output_path / "full.csv")
-    df1.to_excel(output_path / "full.xlsx")
-
     # "Template" format: more human-readable
 
     # Use names instead of IDs for labels in these dimensions
@@ -187,13 +255,81 @@ def make_template(output_path: Optional[Path] = None, verbose: bool = True):
         finally:
             columns[dim_id] = name
 
-    # Apply replacements; use collapse() above to reduce number of columns
-    df2 = df1.replace(replacements).apply(collapse, axis=1).rename(columns=columns)
+    # Apply replacements; use collapse_columns() above to reduce number of columns
+    df2 = collapse_columns(df1.replace(replacements)).rename(columns=columns)
 
-    df2.to_csv(output_path / "condensed.csv", index=False)
-    df2.to_excel(output_path / "condensed.xlsx", index=False)
-
-    # Output the index
+    # The index
     df3 = pd.concat({"FULL": df0, "CONDENSED": df1}, axis=1)
-    df3.to_csv(output_path / "index.csv")
-    df3.to_excel(output_path / "index.xlsx")
+
+    # Variant name → (data, whether to write the index)
+    variants = {"full": (df1, True), "condensed": (df2, False), "index": (df3, True)}
+
+    if workers <= 1:
+        for name, (df, index) in variants.items():
+            _write_variant(df, output_path / name, formats, index)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(variants))) as executor:
+            futures = [
+                executor.submit(_write_variant, df, output_path / name, formats, index)
+                for name, (df, index) in variants.items()
+            ]
+            for future in futures:
+                future.result()
+
+
+def _write_variant(df: pd.DataFrame, path: Path, formats: Sequence[str], index: bool):
+    """Write `df` to `path` with the suffix for each of `formats`."""
+    for fmt in formats:
+        p = path.with_suffix(f".{fmt}")
+        if fmt == "csv":
+            df.to_csv(p, index=index)
+        elif fmt == "parquet":
+            df.to_parquet(p)
+        elif fmt == "xlsx":
+            _write_xlsx(df, p, index)
+
+
+def _write_xlsx(df: pd.DataFrame, path: Path, index: bool) -> None:
+    """Write `df` to an Excel file at `path`, one row at a time.
+
+    Unlike :meth:`pandas.DataFrame.to_excel`, this uses the write-only mode of
+    :mod:`openpyxl`, so memory use does not grow with the number of cells. Column
+    labels are written in one header row per level, as by
+    :meth:`~pandas.DataFrame.to_csv`; missing values are written as empty cells.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+
+    for level in range(df.columns.nlevels):
+        labels = list(df.columns.get_level_values(level))
+        ws.append(([None] if index else []) + labels)
+
+    for row in df.itertuples(index=index, name=None):
+        ws.append([None if pd.isna(v) else v for v in row])
+
+    wb.save(path)
+
+
+def template_keys(sm: "sdmx.message.StructureMessage") -> pd.DataFrame:
+    """Return all keys of the ``HISTORICAL`` data structure in `sm`, one per row."""
+    # TODO Use SDMX constraints to filter on concepts that are parents of other concepts
+    return merge_dsd_frame(
+        sm,
+        "HISTORICAL",
+        [
+            "GDP",
+            "POPULATION",
+            "PRICE_FUEL",
+            "PRICE_POLLUTANT",
+            "ACTIVITY_VEHICLE",
+            "ACTIVITY",
+            "ENERGY",
+            "EMISSIONS",
+            "ENERGY_INTENSITY",
+            "SALES",
+            "STOCK",
+            "LOAD_FACTOR",
+        ],
+    )
@@ -1,5 +1,7 @@
 import os
 import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 import pytest
@@ -60,3 +62,104 @@ def item_tmp_dir(tmp_path_factory, pytestconfig):
         yield tmp_path
     finally:
         pass
+
+
+@pytest.fixture
+def http_server():
+    """Serve files over HTTP from a local server, supporting range requests.
+
+    The fixture value has attributes:
+
+    - ``url``: base URL of the server.
+    - ``files``: dict of path → bytes served, e.g. ``{"/a.csv": b"…"}``.
+    - ``fail``: dict of path → list of HTTP status codes. Each request for the path
+      pops and responds with the first status code, until the list is empty.
+    - ``headers``: dict of path → dict of extra response headers. If these include
+      "ETag", requests with a matching "If-None-Match" header receive a 304 response.
+      A "Range" header is ignored if an "If-Range" header does not match the "ETag" or
+      "Last-Modified" header.
+    - ``truncate``: dict of path → list of byte counts. Each request pops the first
+      count, and the connection is closed after sending that many bytes of the body.
+    - ``requests``: list of (path, headers) for every request. Query strings are
+      ignored.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep connections alive
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            state.requests.append((path, dict(self.headers)))
+
+            if status := (state.fail.get(path) or [None]).pop(0):
+                self.send_error(status)
+                return
+            elif path not in state.files:
+                self.send_error(404)
+                return
+
+            headers = state.headers.get(path, {})
+            if (
+                "ETag" in headers
+                and self.headers.get("If-None-Match") == headers["ETag"]
+            ):
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            data = state.files[path]
+            start = 0
+            range_ = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if if_range and if_range not in (
+                headers.get("ETag"),
+                headers.get("Last-Modified"),
+            ):
+                # Entity has changed; send all of it
+                range_ = None
+            if range_:
+                start = int(range_.split("=")[1].rstrip("-"))
+                if start >= len(data):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(data)}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+                )
+            else:
+                self.send_response(200)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data) - start))
+            self.end_headers()
+            if size := (state.truncate.get(path) or [None]).pop(0):
+                # Simulate an interrupted transfer
+                self.wfile.write(data[start : start + size])
+                self.close_connection = True
+            else:
+                self.wfile.write(data[start:])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+
+    class state:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        files: dict = {}
+        fail: dict = {}
+        headers: dict = {}
+        truncate: dict = {}
+        requests: list = []
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield state
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -7,10 +7,14 @@ COMMANDS = [
     # historical
     ("historical",),
     ("historical", "diagnostics"),
+    ("historical", "fetch"),
     ("historical", "phase1"),
+    ("historical", "process"),
+    ("historical", "profile"),
     # model
     ("model",),
     ("model", "process_raw"),
+    ("model", "process-raw"),
     ("model", "list_pairs"),
     # remote
     ("remote",),
@@ -42,3 +46,32 @@ def test_debug():
     runner = CliRunner()
     result = runner.invoke(item.cli.main, ["debug"])
     assert not result.exception
+
+
+def test_template_format():
+    runner = CliRunner()
+    result = runner.invoke(item.cli.main, ["template", "--format", "csv,foo"])
+    assert 2 == result.exit_code
+    assert "unknown format(s) ['foo']" in result.output
+
+
+def test_historical_sources(monkeypatch):
+    import item.historical
+
+    calls = []
+
+    def process_many(ids, **kwargs):
+        calls.append(ids)
+        return {}, {id: 0.0 for id in ids}
+
+    monkeypatch.setattr(item.historical, "process_many", process_many)
+
+    # Sources can be given as integers or in the “T001” form
+    runner = CliRunner()
+    result = runner.invoke(item.cli.main, ["historical", "process", "T001", "2"])
+    assert 0 == result.exit_code, result.output
+    assert [["T001", "T002"]] == calls
+
+    result = runner.invoke(item.cli.main, ["historical", "process", "foo"])
+    assert 2 == result.exit_code
+    assert "'foo' is not like 1 or T001" in result.output
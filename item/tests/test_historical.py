@@ -7,10 +7,41 @@ import pytest
 
 import item
 from item.common import paths
-from item.historical import fetch_source, input_file, process, source_str
+from item.historical import (
+    cache_results,
+    fetch_many,
+    fetch_source,
+    input_file,
+    iso_alpha_3,
+    iso_alpha_3_column,
+    process,
+    process_many,
+    profile_many,
+    source_ids,
+    source_str,
+    write_profile,
+)
 from item.historical.diagnostic import coverage
 
 
+@pytest.fixture(autouse=True)
+def output_path(monkeypatch, tmp_path):
+    """Write processed data and its cache to a temporary directory."""
+    path = tmp_path.joinpath("output")
+    monkeypatch.setattr(item.historical, "OUTPUT_PATH", path)
+    yield path
+
+
+@pytest.fixture
+def repo_input(monkeypatch):
+    """Use the historical input data from within the repo."""
+    monkeypatch.setitem(
+        paths,
+        "historical input",
+        Path(item.__file__).parent.joinpath("data", "historical", "input"),
+    )
+
+
 @pytest.mark.slow
 @pytest.mark.parametrize(
     "source_id",
@@ -49,6 +80,60 @@ def test_fetch(source_id):
     fetch_source(source_id, use_cache=False)
 
 
+@pytest.mark.parametrize("fmt", ["csv", "feather", "parquet"])
+def test_cache_results(repo_input, output_path, fmt):
+    df = process(0)
+
+    cache_results("T000", df, fmt)
+
+    reader = {
+        "csv": pd.read_csv,
+        "feather": pd.read_feather,
+        "parquet": pd.read_parquet,
+    }[fmt]
+    long = reader(output_path / f"T000-clean.{fmt}")
+    wide = reader(output_path / f"T000-clean-wide.{fmt}")
+
+    assert len(df) == len(long)
+    assert {"NAME", "ITEM_REGION"} < set(wide.columns)
+
+    if fmt != "csv":
+        # Dimensions are stored as categoricals; TIME_PERIOD as integer
+        assert isinstance(long["REF_AREA"].dtype, pd.CategoricalDtype)
+        assert isinstance(wide["ITEM_REGION"].dtype, pd.CategoricalDtype)
+        assert "int64" == long["TIME_PERIOD"].dtype
+
+
+def test_cache_results_invalid():
+    with pytest.raises(ValueError, match="fmt='xlsx'"):
+        cache_results("T000", pd.DataFrame(), "xlsx")
+
+
+def test_cache_results_unknown_area():
+    df = pd.DataFrame(
+        [["DEU", 2020, 1.0], ["XXX", 2020, 2.0]],
+        columns=["REF_AREA", "TIME_PERIOD", "VALUE"],
+    )
+
+    # Codes without a country or area name raise KeyError, rather than giving NaN
+    with pytest.raises(KeyError, match="XXX"):
+        cache_results("T999", df)
+
+
+def test_iso_alpha_3_column():
+    names = pd.Series(
+        ["Germany", "KOREA", "Serbia and Montenegro", "World", "Germany", "bosnia"]
+    )
+
+    # Same results as the scalar function
+    result = iso_alpha_3_column(names)
+    assert names.apply(iso_alpha_3).tolist() == result.tolist()
+
+    # All unresolved names are reported
+    with pytest.raises(LookupError, match=r"2 .*\['Atlantis', 'Narnia'\]"):
+        iso_alpha_3_column(pd.Series(["France", "Atlantis", "Narnia", "Atlantis"]))
+
+
 def test_input_file(item_tmp_dir):
     # Create some temporary files in any order
     files = [
@@ -84,19 +169,144 @@ def test_input_file(item_tmp_dir):
         12,
     ],
 )
-def test_process(caplog, dataset_id):
+def test_process(repo_input, caplog, dataset_id):
     """Test common interface for processing scripts."""
-    # Always use the path from within the repo
-    paths["historical input"] = Path(item.__file__).parent.joinpath(
-        "data", "historical", "input"
-    )
-
     process(dataset_id)
 
     # Processing produced valid results that can be pivoted to wide format
     assert "Processing produced non-unique keys; no -wide output" not in caplog.messages
 
 
+def test_process_cache(repo_input, monkeypatch):
+    # Processing once populates the cache
+    df0 = process(0, use_cache=False)
+
+    # Dataset-specific processing code is not called when the cache is valid
+    def fail(df):
+        raise AssertionError("Not reprocessed")
+
+    monkeypatch.setattr(import_module("item.historical.T000"), "process", fail)
+
+    df1 = process(0)
+    pd.testing.assert_frame_equal(df0, df1)
+
+    # use_cache=False forces processing
+    with pytest.raises(AssertionError, match="Not reprocessed"):
+        process(0, use_cache=False)
+
+
+def test_process_cache_output(repo_input, monkeypatch, output_path):
+    path = output_path.joinpath("T000-clean.csv")
+
+    # Output is written from results with one cache key
+    process(0, use_cache=False)
+
+    # Results with a different cache key, e.g. from changed input data, are processed
+    # and output only in another format
+    monkeypatch.setattr(item.historical, "cache_key", lambda *args: "other")
+    process(0, use_cache=False, fmt="parquet")
+    path.write_text("stale")
+
+    # Output is rewritten from the cached results with the new key
+    process(0)
+    assert len(pd.read_csv(path))
+
+    # …but not if it is already from these results
+    path.write_text("current")
+    process(0)
+    assert "current" == path.read_text()
+
+
+def test_process_validate(repo_input):
+    # T000 uses labels like "Road" and "Activity", which match codes by name or ID
+    assert 90 == len(process(0, use_cache=False, validate=True))
+
+    # Cached results are also validated
+    assert 90 == len(process(0, validate=True))
+
+    # T001 uses labels for MODE and VEHICLE, e.g. "Shipping", that are not in the iTEM
+    # code lists
+    with pytest.raises(RuntimeError, match="93 of 93 observations have keys invalid"):
+        process(1, use_cache=False, validate=True)
+
+
+def test_fetch_many(monkeypatch, http_server, tmp_path) -> None:
+    http_server.files.update({"/a.csv": b"a\n1\n", "/b.csv": b"b\n2\n"})
+    http_server.fail["/b.csv"] = [503]
+    monkeypatch.setitem(paths, "historical input", tmp_path)
+    monkeypatch.setattr(
+        item.historical,
+        "SOURCES",
+        {
+            f"T90{i}": dict(fetch=dict(type="URL", url=f"{http_server.url}/{name}"))
+            for i, name in enumerate(["a.csv", "b.csv", "c.csv"])
+        },
+    )
+
+    results, errors = fetch_many(workers=3, per_host=1, backoff=0)
+
+    # Files are retrieved, retrying after a server error
+    assert {"T900", "T901"} == set(results)
+    assert b"b\n2\n" == results["T901"].read_bytes()
+
+    # Missing file is reported
+    assert {"T902"} == set(errors)
+
+    # Cached files are used
+    n = len(http_server.requests)
+    results, _ = fetch_many(["T900", 901, "T901"])
+    assert ["T900", "T901"] == list(results)
+    assert n == len(http_server.requests)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_process_many(repo_input, workers):
+    # Duplicate IDs, given in different forms, are processed once
+    data, timings = process_many([0, "T000", 1], workers=workers)
+
+    assert ["T000", "T001"] == list(data) == list(timings)
+    assert all(isinstance(df, pd.DataFrame) for df in data.values())
+    assert all(t > 0 for t in timings.values())
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_profile_many(repo_input, tmp_path, workers):
+    report = profile_many([0, 1], workers=workers)
+
+    # One row for each step of processing each data set, plus the total
+    steps = "fetch read check drop process ref_area order validate output total"
+    assert ["source", "step", "seconds", "rows", "peak_rss_mb"] == list(report.columns)
+    assert ["T000"] * 10 + ["T001"] * 10 == report["source"].tolist()
+    assert steps.split() * 2 == report["step"].tolist()
+
+    t000 = report[report["source"] == "T000"].set_index("step")
+    assert t000.loc["fetch", "rows"] is pd.NA
+    assert 90 == t000.loc["total", "rows"] == t000.loc["output", "rows"]
+    assert t000.loc["total", "seconds"] == pytest.approx(t000["seconds"][:-1].sum())
+    # peak_rss_mb() gives None on Windows
+    assert (report["peak_rss_mb"].isna() | (report["peak_rss_mb"] > 0)).all()
+
+    # With the cache, only the first step and loading from cache are performed
+    assert ["fetch", "from_cache", "total"] == profile_many([0], use_cache=True)[
+        "step"
+    ].tolist()
+
+    # Report can be written to file
+    for suffix in ".csv", ".json":
+        path = tmp_path.joinpath("profile").with_suffix(suffix)
+        write_profile(report, path)
+        assert 20 == len(pd.read_csv(path) if suffix == ".csv" else pd.read_json(path))
+
+    with pytest.raises(ValueError, match="use .csv or .json"):
+        write_profile(report, tmp_path.joinpath("profile.txt"))
+
+
+def test_source_ids():
+    result = source_ids()
+    assert "T000" == result[0]
+    assert "T012" in result
+
+
 @pytest.mark.xfail(
     reason="Temporary, pending https://github.com/transportenergy/database/issues/88"
 )
@@ -124,7 +334,7 @@ def test_coverage(dataset_id, N_areas):
         ),
     ),
 )
-def test_diagnostic(id, N, query, expected):
+def test_diagnostic(repo_input, id, N, query, expected):
     """Test checks from :mod:`.historical.diagnostic`."""
     module = import_module(f"item.historical.diagnostic.{id}")
 
@@ -1,11 +1,17 @@
 from os.path import exists, join
 
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
 import pytest
 import xarray as xr
 
+import item.model
 from item.common import paths
 from item.model import (
+    coverage,
     get_model_names,
+    get_region_map,
     load_model_data,
     load_model_regions,
     load_model_scenarios,
@@ -14,12 +20,101 @@ from item.model import (
     process_raw,
     select,
     squash_scenarios,
+    to_wide,
 )
+from item.model.common import INDEX, as_xarray, iter_long, tidy
 
 item1_size = 928541
 item2_size = 1994943
 
 
+@pytest.fixture
+def synthetic_db(monkeypatch, tmp_path):
+    """Synthetic model database version 1, in a temporary directory."""
+    path = tmp_path.joinpath("1.csv")
+    monkeypatch.setitem(paths, "models-1", path)
+    monkeypatch.setitem(paths, "cache", tmp_path.joinpath("cache"))
+    paths["cache"].mkdir()
+
+    data = pd.DataFrame(
+        [
+            ["m1", "s1", "Global", "energy", "All", "All", "All", "PJ", 1.0, 2.0],
+            [
+                "m1",
+                "s1",
+                "Global",
+                "ef_co2 (service)",
+                "All",
+                "All",
+                "All",
+                "g/km",
+                3.0,
+                None,
+            ],
+            ["m2", "s2", "R1", "energy", "LDV", "ICE", "Gasoline", "PJ", None, 4.0],
+            ["2", "s2", "R1", "tkm/a", "Rail", "All", "Electricity", "Gt km", 5.0, 6.0],
+        ],
+        columns="Model Scenario Region Variable Mode Tech Fuel Unit X2005 X2010".split(),
+    )
+    data.to_csv(path, index=False)
+    yield path
+
+
+def _sorted(df):
+    return df.astype(str).sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_load_model_data_store(synthetic_db):
+    data = load_model_data(1)
+    assert 6 == len(data)
+
+    # Data are stored, partitioned by model and variable
+    (store,) = paths["cache"].iterdir()
+    assert 4 == len(list(store.rglob("*.parquet")))
+
+    # Data are read from the store, with identical contents and categorical dimensions
+    data1 = load_model_data(1)
+    pdt.assert_frame_equal(_sorted(data), _sorted(data1))
+    assert isinstance(data1["model"].dtype, pd.CategoricalDtype)
+
+    # Only some models/variables, or other selectors
+    for kwargs, N in (
+        (dict(model="2"), 2),
+        (dict(model="m1", variable=["energy"]), 2),
+        (dict(tech="All", year=2010), 2),
+        (dict(tech="All", year="2010"), 2),
+        (dict(year=["2010", "foo"]), 3),
+        (dict(year="foo"), 0),
+        (dict(mode={"LDV", "Rail"}, fuel="Electricity"), 2),
+    ):
+        expected = load_model_data(1, skip_cache=True, cache=False, **kwargs)
+        result = load_model_data(1, **kwargs)
+        pdt.assert_frame_equal(_sorted(expected), _sorted(result))
+        assert N == len(result)
+
+        # Years are integers with or without the store
+        assert "int64" == expected["year"].dtype == result["year"].dtype
+
+    # select() reads from the store
+    result = select(store, "energy", region="Global")
+    assert 2 == len(result)
+    assert {"energy"} == set(result["variable"])
+
+    # Temporary directory of another process that is writing a store
+    tmp = store.with_name(f"{store.name}.0.tmp")
+    tmp.mkdir()
+
+    # Changed source data invalidates the store
+    synthetic_db.write_text(synthetic_db.read_text().replace("1.0", "1.5", 1))
+    data2 = load_model_data(1)
+    assert 1.5 in set(data2["value"])
+
+    # The old store is removed, but not the temporary directory
+    (store2,) = set(paths["cache"].iterdir()) - {tmp}
+    assert store != store2
+    assert tmp.exists()
+
+
 @pytest.fixture(scope="session")
 def item1_data(item_tmp_dir):
     yield load_model_data(1)
@@ -34,6 +129,79 @@ def test_process_raw(item_tmp_dir, model):
     assert exists(join(paths["model processed"], "2", "%s.csv" % model))
 
 
+@pytest.mark.parametrize("workers", [1, 2])
+def test_process_raw_many(monkeypatch, synthetic_db, tmp_path, workers):
+    import item.model
+    from item.model.common import ModelInfo
+
+    monkeypatch.setitem(paths, "model raw", tmp_path.joinpath("raw"))
+    monkeypatch.setitem(paths, "model processed", tmp_path.joinpath("processed"))
+    paths["model raw"].joinpath("2").mkdir(parents=True)
+
+    # Two models; raw data is missing for the second
+    models = {id: ModelInfo(id=id, format="csv", versions=(2,)) for id in "ab"}
+    monkeypatch.setattr(item.model, "MODELS", models)
+    paths["model raw"].joinpath("2", "a.csv").write_text(synthetic_db.read_text())
+
+    timings, errors = process_raw(2, [], workers=workers)
+
+    # Data is processed for one model, despite the error for the other
+    assert {"a"} == set(timings)
+    assert {"b"} == set(errors)
+    assert isinstance(errors["b"], FileNotFoundError)
+    assert paths["model processed"].joinpath("2", "a.csv").exists()
+
+    # Log messages for each model are written to separate files
+    log_a, log_b = (paths["model processed"] / "2" / id / "process.log" for id in "ab")
+    assert "Processing raw data for a" in log_a.read_text()
+    assert "FileNotFoundError" in log_b.read_text()
+    assert "FileNotFoundError" not in log_a.read_text()
+
+
+def test_process_raw_incremental(monkeypatch, synthetic_db, tmp_path):
+    import item.model
+    from item.model.common import ModelInfo
+
+    monkeypatch.setitem(paths, "model raw", tmp_path.joinpath("raw"))
+    monkeypatch.setitem(paths, "model processed", tmp_path.joinpath("processed"))
+    paths["model raw"].joinpath("2").mkdir(parents=True)
+
+    models = {id: ModelInfo(id=id, format="csv", versions=(2,)) for id in "ab"}
+    monkeypatch.setattr(item.model, "MODELS", models)
+    for id in "ab":
+        paths["model raw"].joinpath("2", f"{id}.csv").write_text(
+            synthetic_db.read_text()
+        )
+
+    def mtimes():
+        return {
+            id: paths["model processed"].joinpath("2", f"{id}.csv").stat().st_mtime_ns
+            for id in "ab"
+        }
+
+    process_raw(2, [])
+    manifest = paths["model processed"].joinpath("2", "a", "manifest.json")
+    assert manifest.exists()
+    before = mtimes()
+
+    # Unchanged inputs: neither model is processed again
+    timings, errors = process_raw(2, [])
+    assert {"a", "b"} == set(timings) and not errors
+    assert before == mtimes()
+
+    # One model resubmits: only that model is processed again
+    paths["model raw"].joinpath("2", "b.csv").write_text(
+        synthetic_db.read_text().replace("1.0", "1.5")
+    )
+    process_raw(2, [])
+    after = mtimes()
+    assert before["a"] == after["a"] and before["b"] != after["b"]
+
+    # Processing is forced
+    process_raw(2, ["a"], force=True)
+    assert after["a"] != mtimes()["a"]
+
+
 @pytest.mark.skip("Requires synthetic model data.")
 @pytest.mark.slow
 @pytest.mark.parametrize("model", ["eppa5"])
@@ -101,6 +269,34 @@ def test_load_model_regions(model, version):
     load_model_regions(model, version)
 
 
+@pytest.mark.parametrize("model", ["item", "message"])
+def test_get_region_map(model):
+    load_models_info()
+    result = get_region_map(model)
+
+    # Every country in every region appears in the map
+    regions = load_model_regions(model, 2)
+    assert sum(len(region.child) for region in regions) == len(result)
+    assert set(result.values()) <= set(r.id for r in regions)
+
+
+def test_get_region_map_overlap(monkeypatch):
+    from sdmx.model.common import Code
+
+    regions = [
+        Code(id="R1", child=[Code(id="AAA"), Code(id="BBB")]),
+        Code(id="R2", child=[Code(id="BBB")]),
+    ]
+    monkeypatch.setattr(item.model, "load_model_regions", lambda *args: regions)
+    get_region_map.cache_clear()
+
+    try:
+        # A country in more than one region gets the last region
+        assert {"AAA": "R1", "BBB": "R2"} == get_region_map("foo")
+    finally:
+        get_region_map.cache_clear()
+
+
 @pytest.mark.parametrize(
     "model",
     ["message", pytest.param("foo", marks=pytest.mark.xfail(raises=ValueError))],
@@ -115,6 +311,190 @@ def test_make_regions_csv(tmp_path):
     make_regions_csv(tmp_path / "output.csv")
 
 
+@pytest.mark.parametrize("fmt", [xr.Dataset, xr.DataArray])
+@pytest.mark.parametrize(
+    "args, kwargs",
+    [
+        (("energy",), dict()),
+        ((), dict(region="Global")),
+        ((), dict(tech="ICE", year=[2005, 2010])),
+        ((), dict(unit="Gt km", year=2010)),
+        (("energy",), dict(mode={"All", "Rail"}, fuel="All")),
+    ],
+)
+def test_select_xarray(synthetic_db, fmt, args, kwargs):
+    df = select(load_model_data(1), *args, **kwargs)
+    data = load_model_data(1, fmt=fmt)
+
+    result = select(data, *args, **kwargs)
+    assert isinstance(result, type(data))
+
+    # Same number of values selected as from pandas.DataFrame
+    assert len(df) == sum(int(da.notnull().sum()) for da in result.values())
+
+    # Selection is lazy for dask-backed arrays
+    pytest.importorskip("dask")
+    chunked = (
+        data.chunk() if fmt is xr.Dataset else {k: v.chunk() for k, v in data.items()}
+    )
+    for da in select(chunked, *args, **kwargs).values():
+        assert da.ndim == 0 or da.chunks is not None
+
+
+def test_iter_long(synthetic_db):
+    from item.model.store import read_store, store_path, write_store
+
+    expected = pd.melt(tidy(pd.read_csv(synthetic_db)), id_vars=INDEX, var_name="year")
+    expected = expected.dropna(subset=["value"])
+
+    chunks = list(iter_long(synthetic_db, chunksize=1))
+    assert 4 == len(chunks)
+    pdt.assert_frame_equal(_sorted(expected), _sorted(pd.concat(chunks)))
+
+    # Chunks are written to the store one at a time
+    path = store_path(1, synthetic_db)
+    write_store(iter_long(synthetic_db, chunksize=1), path)
+    pdt.assert_frame_equal(_sorted(expected), _sorted(read_store(path)))
+
+
+def test_load_model_data_lazy(synthetic_db):
+    pytest.importorskip("dask")
+
+    data = load_model_data(1)
+    lazy = load_model_data(1, lazy=True)
+
+    # One partition per model; same contents
+    assert 3 == lazy.npartitions
+    pdt.assert_frame_equal(_sorted(data), _sorted(lazy.compute()))
+
+    # Other functions operate on the lazy data
+    args, kwargs = ("energy",), dict(region="R1")
+    pdt.assert_frame_equal(
+        _sorted(select(data, *args, **kwargs)),
+        _sorted(select(lazy, *args, **kwargs).compute()),
+    )
+    pdt.assert_frame_equal(
+        _sorted(to_wide(data).reset_index()), _sorted(to_wide(lazy).compute())
+    )
+    pdt.assert_frame_equal(coverage(data), coverage(lazy))
+
+    # Selectors are applied while reading
+    assert {"m1"} == set(load_model_data(1, lazy=True, model="m1")["model"].compute())
+
+
+@pytest.mark.parametrize("fmt", [xr.Dataset, xr.DataArray])
+def test_load_model_data_lazy_xarray(synthetic_db, fmt):
+    pytest.importorskip("dask")
+
+    data = load_model_data(1, fmt=fmt)
+    result = load_model_data(1, fmt=fmt, lazy=True)
+
+    assert set(data.keys()) == set(result.keys())
+    for name, da in result.items():
+        # Backed by dask arrays with one chunk per model
+        if "model" in da.dims:
+            assert (1,) * da.sizes["model"] == da.chunks[da.dims.index("model")]
+
+        xr.testing.assert_identical(data[name], da.compute())
+
+
+def test_coverage(synthetic_db):
+    result = coverage(load_model_data(1))
+
+    assert {"2", "m1", "m2", "# of models"} == set(result.columns)
+    assert [0, 1, 1, 2] == result.loc["energy"].tolist()
+    assert 4 == result.loc["Total", "# of models"]
+
+
+def test_as_xarray(synthetic_db):
+    data = load_model_data(1, cache=False)
+    result = as_xarray(data.copy(), 1, xr.DataArray)
+
+    # Variable names with version-specific fixes
+    assert {"energy", "ef_co2 (/km)", "tkm/a"} == set(result)
+
+    # Same as converting each variable with from_series, then dropping dimensions of
+    # length 1
+    for (variable, unit), df in data.groupby(["variable", "unit"]):
+        da = result[variable.replace("service", unit[-3:])]
+        expected = xr.DataArray.from_series(
+            df.set_index(INDEX + ["year"])["value"].astype(float)
+        )
+        xr.testing.assert_equal(
+            expected.squeeze(drop=True).sortby(list(da.dims)), da.sortby(list(da.dims))
+        )
+        for dim in set(expected.dims) - set(da.dims):
+            assert expected[dim].item() == da.attrs[dim]
+        assert unit == da.attrs["unit"]
+
+    # Duplicate labels cannot be converted
+    with pytest.raises(ValueError, match="non-unique"):
+        as_xarray(pd.concat([data, data.iloc[:1]]), 1, xr.DataArray)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("sparse", [False, True])
+def test_as_xarray_missing_label(synthetic_db, lazy, sparse):
+    if sparse:
+        pytest.importorskip("sparse")
+    dd = pytest.importorskip("dask.dataframe") if lazy else None
+
+    def _as_xarray(df):
+        df = dd.from_pandas(df, npartitions=2) if lazy else df.copy()
+        result = as_xarray(df, 1, xr.DataArray, sparse=sparse)
+        return {k: v.compute() for k, v in result.items()} if lazy else result
+
+    data = load_model_data(1, cache=False)
+    expected = _as_xarray(data)
+
+    # Rows with a missing label, here for "region", are not converted
+    rows = data["variable"] == "energy"
+    result = _as_xarray(pd.concat([data, data[rows].assign(region=np.nan, value=-1.0)]))
+
+    assert set(expected) == set(result)
+    for name, da in result.items():
+        assert da.indexes.get("region", pd.Index([])).is_unique
+        xr.testing.assert_identical(expected[name], da)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_as_xarray_empty(synthetic_db, lazy):
+    dd = pytest.importorskip("dask.dataframe") if lazy else None
+
+    data = load_model_data(1, cache=False).iloc[:0]
+    if lazy:
+        data = dd.from_pandas(data, npartitions=1)
+
+    # Empty data gives no variables
+    assert {} == as_xarray(data.copy(), 1, xr.DataArray)
+    assert 0 == len(as_xarray(data.copy(), 1, xr.Dataset).data_vars)
+
+    # …also for a selection that matches nothing
+    assert 0 == len(load_model_data(1, cache=False, fmt=xr.Dataset, model="nope"))
+
+
+@pytest.mark.parametrize("fmt", [xr.Dataset, xr.DataArray])
+def test_load_model_data_sparse(synthetic_db, fmt):
+    sparse = pytest.importorskip("sparse")
+
+    dense = load_model_data(1, fmt=fmt)
+    result = load_model_data(1, fmt=fmt, sparse=True)
+
+    assert set(dense.keys()) == set(result.keys())
+    for name, da in result.items():
+        if da.ndim == 0:
+            # Variable with a single value
+            xr.testing.assert_identical(dense[name], da)
+            continue
+
+        # Backed by sparse arrays, with only the non-missing values stored
+        assert isinstance(da.data, sparse.COO)
+        assert int(dense[name].notnull().sum()) == da.data.nnz
+
+        # Same contents as the dense array
+        xr.testing.assert_identical(dense[name], da.copy(data=da.data.todense()))
+
+
 @pytest.mark.skip("Requires synthetic model data.")
 def test_select(item1_data):
     from item.model.dimensions import PAX
@@ -124,6 +504,39 @@ def test_select(item1_data):
     assert len(data) == 6752
 
 
+@pytest.mark.parametrize("dtype", [str, "category"])
+def test_squash_scenarios_map(monkeypatch, dtype):
+    import item.model
+
+    # Same scenario name with different categories for different models
+    scenarios = dict(
+        a={"baseline": dict(category="reference"), "2C": dict(category="policy")},
+        b={"baseline": dict(category="reference"), "2C": dict(category="reference")},
+    )
+    monkeypatch.setattr(item.model, "get_model_names", lambda version: ["a", "b"])
+    monkeypatch.setattr(
+        item.model, "load_model_scenarios", lambda name, version: scenarios[name]
+    )
+    item.model.get_scenario_map.cache_clear()
+
+    data = pd.DataFrame(
+        [["a", "baseline"], ["a", "2C"], ["b", "2C"], ["b", "other"], ["c", "2C"]],
+        columns=["model", "scenario"],
+    ).astype(dtype)
+    result = squash_scenarios(data, 2)
+
+    assert ["reference", "policy", "reference", "other", "2C"] == list(
+        result["scenario"]
+    )
+    assert str(data["scenario"].dtype) == str(result["scenario"].dtype)
+    pdt.assert_series_equal(data["model"], result["model"])
+
+    # The mapping is cached
+    monkeypatch.setattr(item.model, "load_model_scenarios", None)
+    squash_scenarios(data, 2)
+    item.model.get_scenario_map.cache_clear()
+
+
 @pytest.mark.skip("Requires synthetic model data.")
 def test_squash_scenarios(item1_data):
     # The input data has multiple scenario names
@@ -1,11 +1,16 @@
+import json
 import os
 
 import pandas as pd
+import pandas.testing as pdt
 import pytest
 from click.testing import CliRunner
 
 import item.cli
+from item.common import paths
 from item.remote import OpenKAPSARC
+from item.remote.openkapsarc import read_manifest
+from item.util import file_hash
 
 
 @pytest.fixture(scope="module")
@@ -31,3 +36,63 @@ def test_cli(ok):
     runner = CliRunner()
     result = runner.invoke(item.cli.main, ["remote", "demo"])
     assert result.exit_code == 0, result.output
+
+
+def test_table_cache(monkeypatch, http_server, tmp_path):
+    monkeypatch.setitem(paths, "historical", tmp_path)
+
+    # Dataset information and export
+    meta = dict(records_count=2, data_processed="2020-01-01")
+    info = dict(
+        dataset=dict(dataset_id="foo", dataset_uid="da_foo", metas=dict(default=meta))
+    )
+
+    def update(data: bytes, etag: str, **kwargs):
+        meta.update(kwargs)
+        http_server.files["/catalog/datasets/foo"] = json.dumps(info).encode()
+        http_server.files[export] = data
+        http_server.headers[export]["ETag"] = etag
+
+    export = "/catalog/datasets/foo/exports/csv"
+    http_server.headers["/catalog/datasets/foo"] = {"Content-Type": "application/json"}
+    http_server.headers[export] = {"Content-Type": "text/csv"}
+    update(b"a;b\n1;2\n3;4\n", '"v1"')
+
+    ok = OpenKAPSARC(server=http_server.url, api_key="bar")
+    df = ok.table("foo")
+    assert 2 == len(df)
+    assert 2 == len(http_server.requests)
+
+    # Manifest is written
+    cache_path = tmp_path.joinpath("da_foo.csv")
+    manifest = read_manifest(cache_path)
+    assert file_hash(cache_path) == manifest["blake2b"]
+    assert (2, '"v1"') == (manifest["records_count"], manifest["etag"])
+
+    # Cached data is used without requesting the export
+    pdt.assert_frame_equal(df, ok.table("foo"))
+    assert 3 == len(http_server.requests)
+
+    # Dataset information changes, but the export does not
+    update(http_server.files[export], '"v1"', data_processed="2020-01-02")
+    assert 2 == len(ok.table("foo"))
+    path, headers = http_server.requests[-1]
+    assert (export, '"v1"') == (path, headers["If-None-Match"])
+    assert 5 == len(http_server.requests)
+    ok.table("foo")
+    assert 6 == len(http_server.requests)
+
+    # Changed export is downloaded
+    update(http_server.files[export] + b"5;6\n", '"v2"', records_count=3)
+    assert 3 == len(ok.table("foo"))
+    assert 3 == len(ok.table("foo", cache=False))
+    assert "If-None-Match" not in http_server.requests[-1][1]
+
+    # Cache with a different size than in the manifest is not used
+    with open(cache_path, "ab") as f:
+        f.write(b"7;8\n")
+    assert {} == read_manifest(cache_path)
+    assert 3 == len(ok.table("foo"))
+
+    # Connections are reused
+    assert 1 == len(ok.session.adapters["http://"].poolmanager.pools)
@@ -0,0 +1,243 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+import requests
+
+import item.remote.sdmx
+from item.remote import download, iter_sdmx, retry, write_sdmx
+from item.remote.download import RetryableError
+
+DATA = b"REF_AREA,TIME_PERIOD,value\n" + b"AUT,2000,1.0\n" * 1000
+
+
+def chunk(area, periods=("2000", "2001")):
+    return pd.DataFrame(
+        dict(
+            REF_AREA=[area] * len(periods),
+            TIME_PERIOD=list(periods),
+            value=range(len(periods)),
+        )
+    ).astype({"REF_AREA": "category", "TIME_PERIOD": "category"})
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_write_sdmx(tmp_path, suffix) -> None:
+    path = tmp_path.joinpath(f"data{suffix}")
+
+    # Chunks with different categories; a missing column and an extra column
+    chunks = [
+        chunk("AUT"),
+        chunk("BEL", ["2002"]).assign(UNIT="km"),
+        chunk("CHE").drop(columns="value"),
+    ]
+
+    assert 5 == write_sdmx(path, chunks)
+
+    df = pd.read_csv(path) if suffix == ".csv" else pd.read_parquet(path)
+    assert ["REF_AREA", "TIME_PERIOD", "value"] == list(df.columns)
+    assert ["AUT", "AUT", "BEL", "CHE", "CHE"] == list(df["REF_AREA"])
+    assert 2 == df["value"].isna().sum()
+
+    # No temporary files remain
+    assert [path] == list(tmp_path.iterdir())
+
+
+def test_write_sdmx_error(tmp_path) -> None:
+    path = tmp_path.joinpath("data.csv")
+
+    def chunks():
+        yield chunk("AUT")
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        write_sdmx(path, chunks())
+
+    # Neither the target file nor a partial file is written
+    assert [] == list(tmp_path.iterdir())
+
+    with pytest.raises(ValueError):
+        write_sdmx(tmp_path.joinpath("data.xlsx"), [])
+
+
+def test_iter_sdmx(monkeypatch) -> None:
+    calls = []
+
+    class Client:
+        def __init__(self, source):
+            pass
+
+        def get(self, resource_type, **kwargs):
+            calls.append(kwargs)
+            if kwargs["key"]["REF_AREA"] == "BEL":
+                # No data for this key
+                raise RuntimeError
+            return SimpleNamespace(data=[[None]], **kwargs)
+
+    monkeypatch.setattr(item.remote.sdmx.sdmx, "Client", Client)
+    monkeypatch.setattr(item.remote.sdmx, "_codes", lambda *args: ["AUT", "BEL", "CHE"])
+    monkeypatch.setattr(
+        item.remote.sdmx, "_to_frame", lambda msg: chunk(msg.key["REF_AREA"])
+    )
+
+    with pytest.raises(RuntimeError):
+        list(iter_sdmx("OECD", split_by="REF_AREA", resource_id="FOO"))
+
+    # HTTP 404 responses are skipped
+    class NotFound(Exception):
+        response = SimpleNamespace(status_code=404)
+
+    def get(self, resource_type, **kwargs):
+        calls.append(kwargs)
+        if kwargs["key"]["REF_AREA"] == "BEL":
+            raise NotFound
+        return SimpleNamespace(data=[[None]], **kwargs)
+
+    monkeypatch.setattr(Client, "get", get)
+    calls.clear()
+
+    result = list(
+        iter_sdmx(
+            "OECD",
+            split_by="REF_AREA",
+            periods=[(1990, 1999), (2000, 2009)],
+            resource_id="FOO",
+            key=dict(MODE="ROAD"),
+        )
+    )
+
+    # One request per code and period range
+    assert 6 == len(calls)
+    assert dict(MODE="ROAD", REF_AREA="CHE") == calls[-1]["key"]
+    assert dict(startPeriod="2000", endPeriod="2009") == calls[-1]["params"]
+    assert 4 == len(result)
+
+    # key must be a dict if split_by is given
+    with pytest.raises(ValueError):
+        next(iter_sdmx("OECD", split_by="REF_AREA", resource_id="FOO", key="ROAD."))
+
+
+def test_download(http_server, tmp_path) -> None:
+    http_server.files["/data.csv"] = DATA
+    path = tmp_path.joinpath("data.csv")
+
+    assert path == download(f"{http_server.url}/data.csv", path)
+    assert DATA == path.read_bytes()
+
+    # No partial file remains
+    assert [path] == list(tmp_path.iterdir())
+
+
+#: Data larger than the chunks in which download() writes a file.
+LARGE = DATA * 20
+
+
+def _interrupt(http_server, url, path) -> int:
+    """Interrupt a download of `url` to `path`; return the size of the partial file."""
+    http_server.truncate["/data.csv"] = [len(LARGE) // 2]
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download(url, path, retries=0)
+    return path.with_name(f"{path.name}.part").stat().st_size
+
+
+def test_download_resume(http_server, tmp_path) -> None:
+    http_server.files["/data.csv"] = LARGE
+    http_server.headers["/data.csv"] = {"ETag": '"v1"'}
+    url, path = f"{http_server.url}/data.csv", tmp_path.joinpath("data.csv")
+
+    # Download is interrupted, leaving a partial file
+    offset = _interrupt(http_server, url, path)
+    assert 0 < offset < len(LARGE)
+
+    download(url, path)
+
+    # The remainder of the same file was requested
+    assert f"bytes={offset}-" == http_server.requests[-1][1]["Range"]
+    assert '"v1"' == http_server.requests[-1][1]["If-Range"]
+    assert LARGE == path.read_bytes()
+    assert [path] == list(tmp_path.iterdir())
+
+    # A complete partial file is used as-is
+    _interrupt(http_server, url, path)
+    tmp_path.joinpath("data.csv.part").write_bytes(LARGE)
+    path.unlink()
+    download(url, path)
+    assert f"bytes={len(LARGE)}-" == http_server.requests[-1][1]["Range"]
+    assert LARGE == path.read_bytes()
+
+
+@pytest.mark.parametrize(
+    "headers, new_data, N",
+    (
+        # File changed; If-Range does not match, so the server sends the whole file
+        ({"ETag": '"v2"'}, LARGE.replace(b"1.0", b"2.0"), 1),
+        ({"Last-Modified": "Tue, 15 Nov 1994 12:45:26 GMT"}, LARGE[:-5], 1),
+        # File changed, but a server does not change the ETag. The Content-Range of the
+        # 206 or 416 response is inconsistent with the partial file
+        ({"ETag": '"v1"'}, LARGE + b"AUT,2001,1.0\n", 2),
+        ({"ETag": '"v1"'}, DATA[:50], 2),
+        # No validator; the partial file cannot be resumed
+        ({}, LARGE, 1),
+    ),
+    ids=["etag", "last-modified", "longer", "shorter", "none"],
+)
+def test_download_resume_changed(http_server, tmp_path, headers, new_data, N) -> None:
+    http_server.files["/data.csv"] = LARGE
+    http_server.headers["/data.csv"] = {"ETag": '"v1"'} if headers else {}
+    url, path = f"{http_server.url}/data.csv", tmp_path.joinpath("data.csv")
+
+    assert _interrupt(http_server, url, path)
+
+    http_server.files["/data.csv"] = new_data
+    http_server.headers["/data.csv"] = headers
+    http_server.requests.clear()
+
+    download(url, path)
+
+    # The new file is downloaded from the start, without bytes from the old file
+    assert new_data == path.read_bytes()
+    assert N == len(http_server.requests)
+
+    # Resuming is attempted only with a validator. If the server responds with an
+    # inconsistent range, the file is requested again, from the start
+    first, last = http_server.requests[0][1], http_server.requests[-1][1]
+    assert bool(headers) == ("If-Range" in first)
+    if N > 1:
+        assert "Range" not in last
+
+
+def test_download_retry(http_server, tmp_path) -> None:
+    http_server.files["/data.csv"] = DATA
+    http_server.fail["/data.csv"] = [503, 500]
+    path = tmp_path.joinpath("data.csv")
+
+    download(f"{http_server.url}/data.csv", path, backoff=0)
+    assert DATA == path.read_bytes()
+    assert 3 == len(http_server.requests)
+
+    # Not found: not retried
+    with pytest.raises(requests.HTTPError):
+        download(f"{http_server.url}/other.csv", path, backoff=0)
+    assert 4 == len(http_server.requests)
+
+    # Retries exhausted
+    http_server.fail["/data.csv"] = [503] * 3
+    with pytest.raises(RetryableError):
+        download(f"{http_server.url}/data.csv", path, retries=2, backoff=0)
+
+
+def test_retry() -> None:
+    calls = []
+
+    def func():
+        calls.append(None)
+        if len(calls) < 3:
+            raise requests.ConnectionError
+        return len(calls)
+
+    assert 3 == retry(func, backoff=0)
+
+    calls.clear()
+    with pytest.raises(requests.ConnectionError):
+        retry(func, retries=1, backoff=0)
+    assert 2 == len(calls)
@@ -2,14 +2,33 @@ import logging
 import re
 from collections.abc import Iterator
 from itertools import product
-from typing import TYPE_CHECKING
+from time import perf_counter
+from typing import TYPE_CHECKING, List
 
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
 import pytest
 import sdmx
 from sdmx.message import StructureMessage
 
+import item.structure.sdmx
 from item.structure import generate, make_template
-from item.structure.sdmx import make_iamc_variable_cl
+from item.structure.sdmx import (
+    KeyValidator,
+    get_constraint,
+    get_validator,
+    iter_frame_keys,
+    key_frame,
+    make_iamc_variable_cl,
+)
+from item.structure.template import (
+    _write_xlsx,
+    collapse,
+    collapse_columns,
+    name_for_id,
+    template_keys,
+)
 
 if TYPE_CHECKING:
     from pathlib import Path
@@ -23,6 +42,37 @@ def item_sdmx_structures() -> Iterator[StructureMessage]:
     yield generate()
 
 
+def test_generate_cache(monkeypatch, tmp_path) -> None:
+    # Use the CROSS_DOMAIN_CONCEPTS from the usual cache, rather than retrieving them
+    # again into `tmp_path`
+    cdc = item.structure.sdmx.get_cdc()
+    monkeypatch.setattr(item.structure.sdmx, "get_cdc", lambda: cdc)
+    monkeypatch.setattr(item.structure.sdmx, "CACHE_PATH", tmp_path)
+    generate.cache_clear()
+
+    try:
+        sm0 = generate()
+
+        # Structures are cached
+        assert 1 == len(list(tmp_path.glob("structure-*.pkl")))
+
+        # Later calls load from the cache, without generating the structures again
+        def fail():
+            raise AssertionError("Structures were generated")
+
+        monkeypatch.setattr(item.structure.sdmx, "_generate", fail)
+        generate.cache_clear()
+        sm1 = generate()
+
+        assert sm0 is not sm1
+        assert set(sm0.structure) == set(sm1.structure)
+
+        # Constraints are preserved
+        assert 906 == len(make_iamc_variable_cl(sm1, "ACTIVITY"))
+    finally:
+        generate.cache_clear()
+
+
 @pytest.mark.parametrize(
     "target, exp_len",
     (
@@ -57,6 +107,85 @@ def test_make_iamc_variable_cl(
     log.info(f"Wrote {path}")
 
 
+@pytest.mark.parametrize(
+    "id", ["ACTIVITY", "EMISSIONS", "GDP", "LOAD_FACTOR", "PRICE_FUEL", "STOCK"]
+)
+def test_key_frame(item_sdmx_structures: StructureMessage, id: str) -> None:
+    dsd = item_sdmx_structures.structure[id]
+    cc = get_constraint(item_sdmx_structures, dsd)
+
+    result = key_frame(dsd, cc)
+
+    # Same keys, in the same order, as DataStructureDefinition.iter_keys()
+    expected = list(dsd.iter_keys(constraint=cc))
+    assert [d.id for d in dsd.dimensions] == list(result.columns)
+    assert [
+        tuple(str(kv.value) for kv in key.values.values()) for key in expected
+    ] == list(result.itertuples(index=False, name=None))
+
+    # sdmx objects can be recovered
+    assert expected == list(iter_frame_keys(result, dsd))
+
+
+def test_key_frame_data_key_set(item_sdmx_structures: StructureMessage) -> None:
+    from sdmx.model.common import BaseDataKey, ComponentValue
+    from sdmx.model.v21 import ContentConstraint, DataKey, DataKeySet
+
+    dsd = item_sdmx_structures.structure["PRICE_FUEL"]
+    dim = dsd.dimensions.get("FUEL")
+    keys: List[BaseDataKey] = [
+        DataKey(included=True, key_value={dim: ComponentValue(value_for=dim, value=v)})
+        for v in ("ELEC", "H2")
+    ]
+
+    cc = ContentConstraint(data_content_keys=DataKeySet(included=True, keys=keys))
+    assert {"ELEC", "H2"} == set(key_frame(dsd, cc)["FUEL"])
+
+    cc = ContentConstraint(data_content_keys=DataKeySet(included=False, keys=keys))
+    result = key_frame(dsd, cc)["FUEL"]
+    assert len(dim.local_representation.enumerated) - 2 == len(result)
+    assert not {"ELEC", "H2"} & set(result)
+
+
+def test_key_validator(item_sdmx_structures: StructureMessage) -> None:
+    dsd = item_sdmx_structures.structure["STOCK"]
+    cc = get_constraint(item_sdmx_structures, dsd)
+    v = get_validator("STOCK")
+
+    # All keys in the unconstrained product of the code lists
+    df = key_frame(dsd).assign(REF_AREA="CHN", TIME_PERIOD=2020, VALUE=1.0)
+
+    # Only the keys within the constraint are valid
+    invalid = v.invalid(df)
+    expected = key_frame(dsd, cc).drop(columns=["REF_AREA", "TIME_PERIOD"])
+    pdt.assert_frame_equal(
+        expected, df[~invalid][expected.columns].reset_index(drop=True)
+    )
+    assert invalid.sum() == len(v.validate(df))
+
+    # Labels match codes by ID or name, ignoring case
+    codes = v.codes["MODE"]
+    assert codes.get_loc("ROAD") == v.labels["MODE"]["road"]
+    assert codes.get_loc("AIR") == v.labels["MODE"]["aviation"]
+
+    # Labels not matching any code, or missing, are invalid
+    df = pd.concat([expected.head(1)] * 4, ignore_index=True)
+    df.loc[1, "MODE"] = df.loc[0, "MODE"].lower()
+    df.loc[2, "MODE"] = "Shipping"
+    df.loc[3, "MODE"] = None
+    assert [False, False, True, True] == v.invalid(df).tolist()
+
+    # Categorical columns give the same result
+    assert [False, False, True, True] == v.invalid(df.astype("category")).tolist()
+
+    # Missing columns
+    with pytest.raises(KeyError, match=r"\['TECHNOLOGY'\]"):
+        v.invalid(df.drop(columns="TECHNOLOGY"))
+
+    # Without a constraint, only code lists are checked
+    assert not KeyValidator(dsd).invalid(key_frame(dsd)).any()
+
+
 def test_make_template(tmp_path) -> None:
     make_template(output_path=tmp_path)
 
@@ -71,6 +200,139 @@ def test_make_template(tmp_path) -> None:
     assert expected_keys + 2 == sum(1 for _ in open(tmp_path / "index.csv"))
 
 
+def test_make_template_formats(tmp_path) -> None:
+    make_template(output_path=tmp_path, formats=["parquet"], workers=1)
+
+    # Only the requested format is written
+    assert {"condensed.parquet", "full.parquet", "index.parquet"} == set(
+        p.name for p in tmp_path.iterdir()
+    )
+    assert 20763 == len(pd.read_parquet(tmp_path / "condensed.parquet"))
+    assert 2 == pd.read_parquet(tmp_path / "index.parquet").columns.nlevels
+
+    with pytest.raises(ValueError, match="unknown template format"):
+        make_template(output_path=tmp_path, formats=["csv", "foo"])
+
+
+@pytest.mark.parametrize("index", [True, False])
+def test_write_xlsx(tmp_path, index) -> None:
+    df = pd.concat(
+        {"A": pd.DataFrame({"x": ["a", "b"], "value": [np.nan, 1.0]})}, axis=1
+    )
+    path = tmp_path / "test.xlsx"
+
+    _write_xlsx(df, path, index)
+
+    # One header row per column level, then the data; NaN is written as empty cells
+    result = pd.read_excel(path, header=None)
+    offset = 1 if index else 0
+    assert (4, 2 + offset) == result.shape
+    assert ["A", "A"] == result.iloc[0, offset:].tolist()
+    assert ["x", "value"] == result.iloc[1, offset:].tolist()
+    assert result.iloc[2, offset + 1] != result.iloc[2, offset + 1]  # NaN
+    assert 1.0 == result.iloc[3, offset + 1]
+
+
+def test_collapse_columns() -> None:
+    columns = (
+        "VARIABLE SERVICE MODE VEHICLE FUEL AUTOMATION OPERATOR POLLUTANT LCA_SCOPE "
+        "FLEET value"
+    ).split()
+    df = pd.DataFrame(
+        [
+            ["Energy", "Total", "Aviation", "Total", "", "", "", "", "", "", ""],
+            [
+                "Emissions",
+                "Passenger",
+                "Light-duty vehicle",
+                "Car",
+                "Gasoline",
+                "Human",
+                "Private",
+                "CO2",
+                "Well-to-wheels",
+                "New",
+                "",
+            ],
+            [
+                "Stock",
+                "Freight",
+                "Light-duty vehicle",
+                "Total",
+                "",
+                "Autonomous",
+                "Commercial",
+                "",
+                "",
+                "Total",
+                "",
+            ],
+            [
+                "Stock",
+                "Total",
+                "Light-duty vehicle",
+                "Bus",
+                "",
+                "Human",
+                "",
+                "",
+                "",
+                "",
+                "",
+            ],
+        ],
+        columns=columns,
+    )
+
+    result = collapse_columns(df)
+
+    # Same result as row-wise collapse()
+    pdt.assert_frame_equal(df.apply(collapse, axis=1), result)
+    assert [
+        "Energy",
+        "CO2 Emissions (Well-to-wheels) (new vehicles)",
+        "Stock",
+        "Stock",
+    ] == result["VARIABLE"].tolist()
+    assert [
+        "Aviation",
+        "Passenger Light-duty vehicle Car (private)",
+        "Freight Light-duty vehicle (commercial AV)",
+        "Light-duty vehicle Bus",
+    ] == result["MODE"].tolist()
+
+
+@pytest.mark.slow
+def test_collapse_columns_benchmark() -> None:
+    """:func:`.collapse_columns` is faster than :func:`.collapse` for all keys."""
+    sm = generate()
+    ids = (
+        "AUTOMATION FLEET FUEL MODE OPERATOR POLLUTANT SERVICE TECHNOLOGY VARIABLE "
+        "VEHICLE"
+    ).split()
+    df = (
+        template_keys(sm)
+        .replace({"_Z": "", np.nan: "", "(REF_AREA)": "…", "(TIME_PERIOD)": "…"})
+        .replace(name_for_id(sm.structure["HISTORICAL"], ids))
+    )
+
+    start = perf_counter()
+    expected = df.apply(collapse, axis=1)
+    t_rows = perf_counter() - start
+
+    start = perf_counter()
+    result = collapse_columns(df)
+    t_columns = perf_counter() - start
+
+    log.info(
+        f"collapse: {t_rows:.3f} s; collapse_columns: {t_columns:.3f} s for "
+        f"{len(df)} keys ({t_rows / t_columns:.0f}× faster)"
+    )
+
+    pdt.assert_frame_equal(expected, result)
+    assert t_columns < t_rows / 10
+
+
 def test_sdmx_roundtrip(tmp_path, item_sdmx_structures: StructureMessage) -> None:
     path = tmp_path / "structure.xml"
 
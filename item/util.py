@@ -1,7 +1,23 @@
+import hashlib
 import logging
+import os
+import shutil
+import sys
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import TYPE_CHECKING, Optional, Sequence, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+    cast,
+)
 
+import numpy as np
 import pandas as pd
 import pooch
 from iam_units import registry
@@ -12,6 +28,9 @@ if TYPE_CHECKING:
 
 log = logging.getLogger(__name__)
 
+#: Sentinel for arguments that are not given.
+_MISSING = object()
+
 
 # TODO Add an argument to control the format of the output units
 def convert_units(
@@ -75,6 +94,137 @@ def dropna_logged(df, column, log_columns=[]):
     return df[~to_drop]
 
 
+def map_categorical(
+    s: pd.Series, mapping: Mapping, default: Any = _MISSING
+) -> pd.Series:
+    """Map the values of `s` using `mapping`.
+
+    Like :meth:`pandas.Series.map`, except each distinct value of `s` is looked up only
+    once, and the results are assigned using the integer category codes of `s`.
+    Values that do not appear in `mapping` are replaced with `default`.
+
+    Raises
+    ------
+    KeyError
+        if `default` is not given and any value of `s` does not appear in `mapping`.
+    """
+    cat = s.astype("category").cat
+
+    if default is _MISSING:
+        if missing := [c for c in cat.categories if c not in mapping]:
+            raise KeyError(missing)
+        default = np.nan
+
+    # Mapped value for each category, plus `default` for missing values, which have
+    # code -1 and so select the last element
+    values = np.array(
+        [mapping.get(c, default) for c in cat.categories] + [default], dtype=object
+    )
+
+    return pd.Series(values[cat.codes.to_numpy()], index=s.index, name=s.name)
+
+
+def file_hash(path: Union[Path, str]) -> str:
+    """Return a hex digest of the contents of the file at `path`.
+
+    The file is read in chunks, so this is suitable for large files.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dir_hash(path: Union[Path, str]) -> str:
+    """Return a hex digest of the names and contents of all files under `path`.
+
+    If `path` does not exist, the digest of an empty directory is returned.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    base = Path(path)
+    for p in sorted(p for p in base.rglob("*") if p.is_file()):
+        h.update(p.relative_to(base).as_posix().encode())
+        h.update(file_hash(p).encode())
+    return h.hexdigest()
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """Context manager for writing `path` atomically, in case of concurrent processes.
+
+    Yields a temporary path, :file:`{path}.{pid}.tmp`, for the caller to write a file or
+    directory. On normal exit, this replaces `path`, so other processes never see a
+    partly-written `path`. If an exception occurs, the temporary path is removed and
+    `path` is unchanged.
+
+    If `path` is a directory that another process created while the temporary one was
+    written, it is kept, and the temporary directory is discarded.
+
+    See also
+    --------
+    write_atomic
+    """
+
+    def _remove(p: Path) -> None:
+        if p.is_dir():
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            p.unlink(missing_ok=True)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    _remove(tmp)
+    try:
+        yield tmp
+    except BaseException:
+        _remove(tmp)
+        raise
+
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        if not (tmp.is_dir() and path.is_dir()):
+            raise
+        # Another process wrote the same directory
+        _remove(tmp)
+
+
+def write_atomic(path: Path, data: Union[bytes, str]) -> None:
+    """Write `data` to `path` using :func:`atomic_path`."""
+    with atomic_path(path) as tmp:
+        if isinstance(data, str):
+            tmp.write_text(data)
+        else:
+            tmp.write_bytes(data)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Return the peak resident set size of the current process, in MiB.
+
+    Returns :obj:`None` on platforms without :mod:`resource`, e.g. Windows.
+    """
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return None
+
+    # ru_maxrss is in bytes on macOS and in KiB on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+@lru_cache()
+def package_version() -> str:
+    """Return the version of the installed :mod:`item` package, or "unknown"."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("transport-energy")
+    except PackageNotFoundError:  # pragma: no cover
+        return "unknown"
+
+
 POOCH = pooch.create(
     path=user_cache_path("item"),
     base_url="https://github.com/transportenergy/metadata/archive/refs/heads",